@@ -1,9 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import data
+from routers import data, replay
+from services.compression import CompressionMiddleware
+from services.http_cache import ConditionalGetMiddleware
 
 app = FastAPI()
 
+# Outermost last: CORS -> compression -> conditional GET -> routes.
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -13,6 +19,7 @@ app.add_middleware(
 )
 
 app.include_router(data.router)
+app.include_router(replay.router)
 
 @app.get("/")
 def read_root():
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, Query
-from services.pkl_loader import load_pkl, list_signals, extract_series, DEFAULT_FS
+import itertools
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from services.pkl_loader import load_pkl, list_signals, extract_array, iter_array_chunks, series_to_json, DEFAULT_FS, SUBJECT_CACHE
 from services.overall_data.heart_rate import get_heart_rate
 from services.overall_data.breathing_rate import get_breathing_rate
 from services.overall_data.stress_level import get_stress_level
@@ -7,9 +9,84 @@ from services.overall_data.temperature import get_temperature
 from services.overall_data.pulse_transit_time import get_pulse_transit_time
 from services.overall_data.skin_conductance import get_skin_conductance
 from services.subject_info import load_subject_info
-from services.overall_data_analysis.health_analysis import get_comprehensive_health_analysis
+from services.overall_data_analysis.health_analysis import complete, get_comprehensive_health_analysis
+from services.overall_data_analysis.cohort import COHORT_METRICS, iter_cohort
+from services.signal_store import discover_subjects
+from services.wire_format import (
+    BINARY_MEDIA_TYPE, JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, encode, iter_binary_frames, iter_ndjson, negotiate
+)
+from services.downsampling import METHODS, downsample_series
+from services import pyramid
+from services.result_cache import IN_FLIGHT, RESULT_CACHE
+from services import executor
+from services.executor import offload
+from services.json_response import NumpyJSONResponse, dumps
 
-router = APIRouter(prefix="/data", tags=["data"])
+router = APIRouter(prefix="/data", tags=["data"], default_response_class=NumpyJSONResponse)
+
+
+def output_options(
+    target_points: int | None = Query(
+        None, ge=3, description="Downsample the result to about this many points"
+    ),
+    downsample: str = Query(
+        "lttb", pattern=f"^({'|'.join(METHODS)})$", description="lttb | minmax | mean"
+    ),
+    precision: int | None = Query(
+        None, ge=0, le=15, description="Round values to this many decimals (JSON and NDJSON)"
+    ),
+) -> dict:
+    return {"target_points": target_points, "downsample": downsample, "precision": precision}
+
+
+def time_range(
+    start_sec: float | None = Query(None, ge=0, description="Window start (s from recording start)"),
+    end_sec: float | None = Query(None, ge=0, description="Window end (s from recording start)"),
+) -> dict:
+    if start_sec is not None and end_sec is not None and end_sec <= start_sec:
+        raise HTTPException(status_code=400, detail="end_sec must be greater than start_sec")
+    return {"start_sec": start_sec, "end_sec": end_sec}
+
+
+def windowing(
+    window_sec: float = Query(5.0, gt=0, description="Window length in seconds"),
+    step_sec: float | None = Query(
+        None, gt=0, description="Seconds between window starts (default window_sec; smaller overlaps)"
+    ),
+) -> dict:
+    return {"window_sec": window_sec, "step_sec": step_sec}
+
+
+def _stream(request: Request, obj, precision: int | None = None, **selection):
+    """
+    Chunked export of a raw series: NDJSON lines by default, binary frames for
+    Accept: application/octet-stream. The first chunk is read up front so bad
+    sensor/modality names still get a 400 instead of a truncated body.
+    """
+    chunks = iter_array_chunks(obj, **selection)
+    try:
+        first = next(chunks)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid key: {e}")
+    chunks = itertools.chain([first], chunks)
+    if negotiate(request.headers.get("accept")) == BINARY_MEDIA_TYPE:
+        return StreamingResponse(iter_binary_frames(chunks), media_type=BINARY_MEDIA_TYPE)
+    return StreamingResponse(iter_ndjson(chunks, precision), media_type=NDJSON_MEDIA_TYPE)
+
+
+def _respond(request: Request, series: dict, options: dict):
+    """
+    Optionally downsample a series (target_points), then serialize it in the
+    format picked by the Accept header: JSON by default (written straight from
+    the arrays, see services/json_response), or application/octet-stream /
+    Arrow IPC (see services/wire_format).
+    """
+    if options["target_points"]:
+        series = downsample_series(series, options["target_points"], options["downsample"])
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type == JSON_MEDIA_TYPE:
+        return NumpyJSONResponse(series_to_json(series, as_array=True), precision=options["precision"])
+    return Response(content=encode(series, media_type), media_type=media_type)
 
 
 @router.get("/info")
@@ -22,41 +99,96 @@ def get_info(subject: str = Query("S2", description="Subject ID, e.g. S2")):
     return list_signals(obj)
 
 
+@router.get("/cache")
+async def cache_stats():
+    """
+    Hit/miss/eviction counters and bytes held by the subject data cache, plus
+    the on-disk result cache under "results".
+    """
+    results = {**RESULT_CACHE.stats(), "single_flight": IN_FLIGHT.stats()}
+    return {**SUBJECT_CACHE.stats(), "results": results}
+
+
+@router.get("/executor")
+async def executor_stats():
+    """Queue depth, in-flight calls and worker utilisation of the CPU pool."""
+    return executor.stats()
+
+
 @router.get("/series")
 def get_series(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
     sensor: str = Query("wrist", description="wrist | chest | label"),
     modality: str = Query(
         "EDA", description="e.g. EDA, BVP, TEMP, ACC, ECG, RESP, EMG, LABEL"
     ),
     axis: str | None = Query(None, description="For ACC: x|y|z|mag"),
-    stride: int = Query(10, ge=1, description="Return every Nth sample"),
+    stride: int | None = Query(
+        None, ge=1, description="Return every Nth sample (default 10, or 1 with target_points/stream)"
+    ),
     limit: int | None = Query(
-        5000, ge=1, description="Max samples after stride (None for all)"
+        None, ge=1, description="Max samples after stride (default 5000, or all with target_points/stream)"
+    ),
+    stream: bool = Query(
+        False, description="Stream every selected sample in chunks (NDJSON, or binary frames via Accept)"
     ),
 ):
     path = f"data/WESAD/{subject}/{subject}.pkl"
+    if stream:
+        try:
+            obj = load_pkl(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"File not found: {path}")
+        return _stream(
+            request, obj, options["precision"], sensor=sensor, modality=modality, axis=axis,
+            stride=stride or 1, limit=limit, **span
+        )
+    if options["target_points"] is None:
+        stride = stride or 10
+        limit = limit or 5000
+    elif stride is None and limit is None:
+        # Zoomed views are answered from the precomputed pyramid when one exists.
+        try:
+            series = pyramid.query(
+                path, sensor, modality, axis, options["target_points"], options["downsample"], **span
+            )
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"File not found: {path}")
+        if series is not None:
+            return _respond(request, series, options)
+    stride = stride or 1
     try:
         obj = load_pkl(path)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"File not found: {path}")
     try:
-        chart = extract_series(
-            obj, sensor=sensor, modality=modality, axis=axis, stride=stride, limit=limit
+        series = extract_array(
+            obj, sensor=sensor, modality=modality, axis=axis, stride=stride, limit=limit, **span
         )
     except KeyError as e:
         raise HTTPException(status_code=400, detail=f"Invalid key: {e}")
-    return chart
+    return _respond(request, series, options)
 
 
 @router.get("/heart_rate")
-def heart_rate(
+async def heart_rate(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
     sensor: str = Query("chest", description="ECG usually from chest sensor"),
     modality: str = Query("ECG", description="Signal to derive heart rate from"),
+    mode: str = Query(
+        "window", pattern="^(window|beat)$", description="window: BPM per window | beat: beat-to-beat BPM"
+    ),
 ):
     try:
-        return get_heart_rate(subject, sensor, modality)
+        result = await offload(get_heart_rate, subject, sensor, modality, mode=mode, **span, **windows)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject file not found: {subject}"
@@ -66,11 +198,18 @@ def heart_rate(
 
 
 @router.get("/breathing_rate")
-def get_breathing_rate_endpoint(
+async def get_breathing_rate_endpoint(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
 ):
+    winsec = windows["window_sec"]
+    step_sec = windows["step_sec"] or winsec
     try:
-        return get_breathing_rate(subject, winsec=5, step_sec=5)
+        result = await offload(get_breathing_rate, subject, winsec=winsec, step_sec=step_sec, **span)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"File not found: {subject}")
     except KeyError:
@@ -84,16 +223,22 @@ def get_breathing_rate_endpoint(
 
 
 @router.get("/stress_level")
-def stress_level(
+async def stress_level(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
     sensor: str = Query("wrist", description="Use wrist for EDA and TEMP"),
 ):
     try:
-        return get_stress_level(subject, sensor)
+        result = await offload(get_stress_level, subject, sensor, **span)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject file not found: {subject}"
         )
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Modality error: {e}")
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error computing stress level: {e}"
@@ -101,13 +246,18 @@ def stress_level(
 
 
 @router.get("/temperature")
-def temperature(
+async def temperature(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
     sensor: str = Query("wrist", description="wrist | chest"),
     modality: str = Query("TEMP", description="TEMP or Temp depending on file"),
 ):
     try:
-        return get_temperature(subject, sensor, modality)
+        result = await offload(get_temperature, subject, sensor, modality, **span, **windows)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject file not found: {subject}"
@@ -119,7 +269,11 @@ def temperature(
 
 
 @router.get("/movement")
-def movement(
+async def movement(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
     sensor: str = Query("wrist", description="wrist | chest"),
     modality: str = Query("ACC", description="Accelerometer modality (ACC)"),
@@ -127,7 +281,8 @@ def movement(
     from services.overall_data.movement import get_movement
 
     try:
-        return get_movement(subject, sensor, modality)
+        result = await offload(get_movement, subject, sensor, modality, **span, **windows)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject file not found: {subject}"
@@ -139,11 +294,18 @@ def movement(
 
 
 @router.get("/pulse_transit_time")
-def pulse_transit_time(
+async def pulse_transit_time(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
 ):
+    winsec = windows["window_sec"]
+    step_sec = windows["step_sec"] or winsec
     try:
-        return get_pulse_transit_time(subject, winsec=5, step_sec=5)
+        result = await offload(get_pulse_transit_time, subject, winsec=winsec, step_sec=step_sec, **span)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject file not found: {subject}"
@@ -155,13 +317,18 @@ def pulse_transit_time(
 
 
 @router.get("/skin_conductance")
-def skin_conductance(
+async def skin_conductance(
+    request: Request,
+    options: dict = Depends(output_options),
+    span: dict = Depends(time_range),
+    windows: dict = Depends(windowing),
     subject: str = Query("S2"),
     sensor: str = Query("wrist", description="wrist | chest"),
     modality: str = Query("EDA"),
 ):
     try:
-        return get_skin_conductance(subject, sensor, modality)
+        result = await offload(get_skin_conductance, subject, sensor, modality, **span, **windows)
+        return _respond(request, result, options)
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"File not found for subject {subject}"
@@ -185,7 +352,11 @@ def health_analysis(
     subject: str = Query("S2", description="Subject ID, e.g. S2"),
 ):
     try:
-        return get_comprehensive_health_analysis(subject)
+        result = get_comprehensive_health_analysis(subject)
+        if not complete(result):
+            # Partial: neither cached nor tagged, so the client retries later.
+            return NumpyJSONResponse(result, headers={"Cache-Control": "no-store"})
+        return result
     except FileNotFoundError:
         raise HTTPException(
             status_code=404, detail=f"Subject data not found: {subject}"
@@ -194,3 +365,36 @@ def health_analysis(
         raise HTTPException(
             status_code=500, detail=f"Health analysis failed: {type(e).__name__}: {e}"
         )
+
+
+@router.get("/cohort")
+def cohort(
+    subjects: str | None = Query(None, description="Comma-separated subject IDs (default: all)"),
+    metrics: str = Query(
+        ",".join(COHORT_METRICS), description=f"Comma-separated subset of {', '.join(COHORT_METRICS)}"
+    ),
+    stream: bool = Query(True, description="NDJSON lines per subject as they finish, then the aggregates"),
+):
+    """
+    Metric summaries for many subjects, computed in parallel (one process-pool
+    job per subject), plus cohort mean / std / min / max / percentiles.
+    """
+    names = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in names if m not in COHORT_METRICS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown metrics: {', '.join(unknown) or '(none)'}; expected {', '.join(COHORT_METRICS)}"
+        )
+    available = discover_subjects()
+    ids = [s.strip() for s in subjects.split(",") if s.strip()] if subjects else available
+    missing = [s for s in ids if s not in available]
+    if missing or not ids:
+        raise HTTPException(status_code=404, detail=f"Subject data not found: {', '.join(missing) or '(none)'}")
+
+    lines = iter_cohort(ids, names)
+    if not stream:
+        *per_subject, summary = lines
+        return {**{k: v for k, v in summary.items() if k != "type"}, "results": per_subject}
+    return StreamingResponse(
+        (dumps(line) + b"\n" for line in lines), media_type=NDJSON_MEDIA_TYPE
+    )
@@ -0,0 +1,220 @@
+"""
+WebSocket replay of a recorded subject, paced as if the signals were live.
+
+    ws://localhost:8000/replay?subject=S2&signals=chest.ECG,chest.RESP,wrist.EDA,wrist.ACC.mag&speed=4
+
+signals is a comma separated list of sensor.modality[.axis] (or "label").
+Messages sent to the client:
+
+    text    {"type": "start", "subject", "speed", "tick_sec", "start_sec",
+             "duration_sec", "signals": [{"id", "fs", "chart_title", "y_label"}]}
+    binary  one frame per tick: the WSB1 payload (services/wire_format) of every
+            signal in "signals" order, each padded to 8 bytes, so
+            wire_format.decode_frames splits it. Each payload's t0 is the
+            recording time of its first sample, so multi-rate signals line up.
+    text    {"type": "metrics", "t", "heart_rate", "breathing_rate", "eda_level", "dropped"}
+            every METRICS_EVERY_SEC of recording time; each metric is
+            {"t", "value"} or null, computed by the same services as the
+            /data endpoints over the trailing METRICS_WINDOW_SEC.
+    text    {"type": "end", "t", "dropped"}
+    text    {"type": "error", "detail"} if the replay fails, then the socket is
+            closed with code 1011.
+
+Every connection gets a bounded queue between the pacing loop and the socket.
+When a client cannot keep up, the oldest queued messages are dropped (and
+counted in "dropped") instead of buffering without limit or slowing the
+pacing loop.
+"""
+import asyncio, math
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from services.pkl_loader import load_pkl, row_values, select_rows
+from services.executor import offload
+from services.resampling import parse_signal
+from services.wire_format import iter_binary_frames
+from services.overall_data.heart_rate import get_heart_rate
+from services.overall_data.breathing_rate import get_breathing_rate
+from services.overall_data.skin_conductance import get_skin_conductance
+
+router = APIRouter(tags=["replay"])
+
+DEFAULT_SIGNALS = "chest.ECG,chest.RESP,wrist.EDA"
+MAX_SPEED = 100.0
+# Wall-clock seconds between frames.
+TICK_SEC = 0.1
+# Messages buffered per client before the oldest are dropped (5 s at speed 1).
+QUEUE_MESSAGES = 50
+METRICS_EVERY_SEC = 5.0
+METRICS_WINDOW_SEC = 15.0
+
+
+def _open_streams(obj, signals: str):
+    """Parse the signals parameter into (id, sensor, modality, axis, rows, meta)."""
+    streams = []
+    for spec in filter(None, (s.strip() for s in signals.split(","))):
+        sensor, modality, axis = parse_signal(spec)
+        rows, meta = select_rows(obj, sensor, modality, axis=axis)
+        streams.append((spec, sensor, modality, axis, rows, meta))
+    if not streams:
+        raise ValueError("No signals requested")
+    return streams
+
+
+def _frame(streams, t_from: float, t_to: float) -> bytes:
+    """All samples with timestamps in [t_from, t_to), one payload per signal."""
+    chunks = []
+    for _, sensor, modality, axis, rows, meta in streams:
+        fs = meta["fs"]
+        a = min(len(rows), int(math.ceil(t_from * fs - 1e-9)))
+        b = min(len(rows), int(math.ceil(t_to * fs - 1e-9)))
+        chunk = dict(meta)
+        chunk["t0"] = a / fs
+        chunk["y_values"] = row_values(rows[a:b], sensor, modality, axis)
+        chunks.append(chunk)
+    return b"".join(iter_binary_frames(chunks))
+
+
+def _latest(compute, *args, **kwargs):
+    try:
+        result = compute(*args, **kwargs)
+    except Exception:
+        return None
+    if not len(result["y_values"]):
+        return None
+    return {"t": float(result["x_values"][-1]), "value": float(result["y_values"][-1])}
+
+
+def _derived_metrics(subject: str, t: float) -> dict:
+    # Every tick has its own range, so results bypass the result cache
+    # instead of filling it with entries nobody asks for again.
+    span = {"start_sec": max(0.0, t - METRICS_WINDOW_SEC), "end_sec": t}
+    return {
+        "heart_rate": _latest(get_heart_rate.uncached, subject, **span),
+        "breathing_rate": _latest(get_breathing_rate.uncached, subject, winsec=5, step_sec=5, **span),
+        "eda_level": _latest(get_skin_conductance.uncached, subject, **span),
+    }
+
+
+def _offer(queue: asyncio.Queue, message, state: dict) -> None:
+    """Queue a message without waiting; drop the oldest one if the client lags."""
+    while True:
+        try:
+            queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            queue.get_nowait()
+            state["dropped"] += 1
+
+
+async def _metrics(subject: str, t: float, queue: asyncio.Queue, state: dict) -> None:
+    metrics = await offload(_derived_metrics, subject, t)
+    _offer(queue, {"type": "metrics", "t": t, **metrics, "dropped": state["dropped"]}, state)
+
+
+async def _produce(subject, streams, speed, start_sec, duration, queue, state) -> None:
+    loop = asyncio.get_running_loop()
+    wall0 = loop.time()
+    span = TICK_SEC * speed
+    metrics_task = None
+    next_metrics = start_sec + METRICS_EVERY_SEC
+    k = 0
+    t = start_sec
+    try:
+        while t < duration:
+            await asyncio.sleep(max(0.0, wall0 + k * TICK_SEC - loop.time()))
+            t_next = min(duration, start_sec + (k + 1) * span)
+            _offer(queue, _frame(streams, t, t_next), state)
+            # Metrics run beside the pacing loop; a due update is skipped while
+            # the previous one is still computing.
+            if t_next >= next_metrics:
+                if metrics_task is None or metrics_task.done():
+                    if metrics_task is not None:
+                        metrics_task.result()  # re-raises a failed update
+                    metrics_task = asyncio.create_task(_metrics(subject, t_next, queue, state))
+                next_metrics = (math.floor(t_next / METRICS_EVERY_SEC) + 1) * METRICS_EVERY_SEC
+            t = t_next
+            k += 1
+        if metrics_task is not None:
+            await metrics_task
+        await queue.put({"type": "end", "t": t, "dropped": state["dropped"]})
+    except Exception as e:
+        state["failed"] = True
+        _offer(queue, {"type": "error", "detail": f"Replay failed: {type(e).__name__}: {e}"}, state)
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+        # Never blocks, so the sender always gets its sentinel, even when the
+        # producer is cancelled with a full queue.
+        _offer(queue, None, state)
+
+
+async def _send(websocket: WebSocket, queue: asyncio.Queue) -> None:
+    while True:
+        message = await queue.get()
+        if message is None:
+            return
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_json(message)
+
+
+async def _watch_disconnect(websocket: WebSocket) -> None:
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+@router.websocket("/replay")
+async def replay(
+    websocket: WebSocket,
+    subject: str = Query("S2", description="Subject ID, e.g. S2"),
+    signals: str = Query(DEFAULT_SIGNALS, description="Comma separated sensor.modality[.axis], or label"),
+    speed: float = Query(1.0, gt=0, le=MAX_SPEED, description="Replay speed factor (1 = real time)"),
+    start_sec: float = Query(0.0, ge=0, description="Recording time to start from"),
+):
+    await websocket.accept()
+    path = f"data/WESAD/{subject}/{subject}.pkl"
+    try:
+        obj = await asyncio.to_thread(load_pkl, path)
+        streams = await asyncio.to_thread(_open_streams, obj, signals)
+    except FileNotFoundError:
+        await websocket.send_json({"type": "error", "detail": f"File not found: {path}"})
+        await websocket.close(code=1008)
+        return
+    except (KeyError, ValueError) as e:
+        await websocket.send_json({"type": "error", "detail": f"Invalid signal: {e}"})
+        await websocket.close(code=1008)
+        return
+
+    duration = max(len(rows) / meta["fs"] for *_, rows, meta in streams)
+    await websocket.send_json({
+        "type": "start",
+        "subject": subject,
+        "speed": speed,
+        "tick_sec": TICK_SEC,
+        "start_sec": start_sec,
+        "duration_sec": duration,
+        "signals": [
+            {"id": spec, "fs": meta["fs"], "chart_title": meta["chart_title"], "y_label": meta["y_label"]}
+            for spec, *_, meta in streams
+        ],
+    })
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MESSAGES)
+    state = {"dropped": 0, "failed": False}
+    producer = asyncio.create_task(_produce(subject, streams, speed, start_sec, duration, queue, state))
+    sender = asyncio.create_task(_send(websocket, queue))
+    watcher = asyncio.create_task(_watch_disconnect(websocket))
+    try:
+        await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (producer, sender, watcher):
+            task.cancel()
+    if sender.done() and not sender.cancelled() and sender.exception() is None:
+        try:
+            await websocket.close(code=1011 if state["failed"] else 1000)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
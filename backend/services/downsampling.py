@@ -0,0 +1,152 @@
+"""
+Shape-preserving downsampling for plotting.
+
+Every method reduces (x, y) to about `target_points` points:
+
+- "lttb":   Largest-Triangle-Three-Buckets; keeps the visually dominant point of
+            each bucket, so ECG R-peaks and EDA spikes survive.
+- "minmax": min and max of each bucket, in time order (envelope view).
+- "mean":   bucket average, placed at the bucket's mean timestamp.
+
+Buckets are contiguous index ranges. minmax and mean are single reduceat
+passes over the array; lttb precomputes bucket averages the same way and then
+walks the buckets (not the samples), so a 4M-sample ECG reduced to 2,000 points
+costs 2,000 small vectorised steps.
+
+NaN samples (signal gaps) are ignored by every method; a bucket with no valid
+sample is represented by its first sample (minmax, lttb) or NaN (mean).
+"""
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+METHODS = ("lttb", "minmax", "mean")
+
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+
+def _x_axis(x: Optional[np.ndarray], n: int) -> np.ndarray:
+    return np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+
+def _bucket_means(y: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Mean of the valid samples of each bucket (NaN for an all-NaN bucket)."""
+    valid = ~np.isnan(y)
+    total = np.add.reduceat(np.where(valid, y, 0.0), starts)
+    count = np.add.reduceat(valid.astype(np.float64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def minmax(x: Optional[np.ndarray], y: np.ndarray, target_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    buckets = max(1, target_points // 2)
+    if n <= target_points or buckets >= n:
+        return _x_axis(x, n), y
+    # Equal-width buckets laid out as a 2-D view (the last one padded), so the
+    # per-bucket argmin/argmax is a single reduction along axis 1. NaN gaps
+    # never win; an all-NaN bucket falls back to its first sample.
+    width = -(-n // buckets)
+    buckets = -(-n // width)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, width)
+    nan = np.isnan(grid)
+    offsets = np.arange(buckets) * width
+    idx_min = offsets + np.argmin(np.where(nan, np.inf, grid), axis=1)
+    idx_max = offsets + np.argmax(np.where(nan, -np.inf, grid), axis=1)
+    idx = np.sort(np.stack([np.minimum(idx_min, n - 1), np.minimum(idx_max, n - 1)], axis=1), axis=1).reshape(-1)
+    idx = idx[np.concatenate([[True], np.diff(idx) != 0])]
+    return _x_axis(x, n)[idx], y[idx]
+
+
+def mean(x: Optional[np.ndarray], y: np.ndarray, target_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n <= target_points:
+        return _x_axis(x, n), y
+    edges = _bucket_edges(n, target_points)
+    starts, counts = edges[:-1], np.diff(edges)
+    xs = _x_axis(x, n)
+    return np.add.reduceat(xs, starts) / counts, _bucket_means(y, starts)
+
+
+def lttb(x: Optional[np.ndarray], y: np.ndarray, target_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n <= target_points or target_points < 3:
+        return _x_axis(x, n), y
+    xs = _x_axis(x, n)
+
+    # First and last points are kept; the rest is split into target - 2 buckets.
+    edges = 1 + _bucket_edges(n - 2, target_points - 2)
+    starts, counts = edges[:-1], np.diff(edges)
+    avg_x = np.add.reduceat(xs, starts) / counts
+    avg_y = _bucket_means(y, starts)
+    # The "next" point for bucket i is the average of bucket i + 1 (the last
+    # point for the final bucket); all-NaN buckets borrow the next valid one.
+    next_x = np.append(avg_x[1:], xs[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+    valid_next = ~np.isnan(next_y)
+    if valid_next.any() and not valid_next.all():
+        fill = np.minimum.accumulate(np.where(valid_next, np.arange(next_y.size), next_y.size)[::-1])[::-1]
+        fill = np.minimum(fill, np.flatnonzero(valid_next)[-1])
+        next_x, next_y = next_x[fill], next_y[fill]
+
+    # LTTB picks each point relative to the point selected in the previous
+    # bucket, which is inherently sequential. The per-bucket work is a single
+    # vectorised area computation over that bucket's slice.
+    selected = np.empty(target_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    # The triangle is anchored at the last selected point that is not NaN.
+    finite = np.flatnonzero(~np.isnan(y))
+    prev = int(finite[0]) if finite.size else 0
+    for i in range(target_points - 2):
+        lo, hi = starts[i], starts[i] + counts[i]
+        ax, ay = xs[prev], y[prev]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - xs[lo:hi]) * (next_y[i] - ay))
+        pick = lo + int(np.argmax(np.where(np.isnan(area), -1.0, area)))
+        selected[i + 1] = pick
+        if not np.isnan(y[pick]):
+            prev = pick
+    return xs[selected], y[selected]
+
+
+def downsample(
+    x: Optional[np.ndarray], y: np.ndarray, target_points: int, method: str = "lttb"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a series to about target_points points. x may be None for evenly
+    spaced samples (indices are returned as x and can be scaled by the caller).
+    Raises ValueError for an unknown method.
+    """
+    if method == "lttb":
+        return lttb(x, y, target_points)
+    if method == "minmax":
+        return minmax(x, y, target_points)
+    if method == "mean":
+        return mean(x, y, target_points)
+    raise ValueError(f"Unknown downsampling method: {method} (expected one of {', '.join(METHODS)})")
+
+
+def downsample_series(series: Dict[str, Any], target_points: int, method: str = "lttb") -> Dict[str, Any]:
+    """
+    Downsample a series dict, either an extract_array result (t0/dt, ndarray
+    y_values) or a metric result (x_values/y_values). The result always carries
+    explicit x_values, because the kept points are no longer evenly spaced.
+    """
+    y = np.asarray(series["y_values"], dtype=np.float64).reshape(-1)
+    if y.size <= target_points:
+        return series
+    if "dt" in series:
+        xs, ys = downsample(None, y, target_points, method)
+        xs = series["t0"] + xs * series["dt"]
+    else:
+        xs, ys = downsample(np.asarray(series["x_values"], dtype=np.float64), y, target_points, method)
+    out = {k: v for k, v in series.items() if k not in ("fs", "t0", "dt")}
+    out["x_values"] = xs
+    out["y_values"] = ys
+    return out
@@ -0,0 +1,210 @@
+"""
+Executor layer for CPU-heavy work called from async routes.
+
+The metric endpoints are async and hand their service call to offload(),
+which runs it on one shared, bounded pool instead of the anyio threadpool, so
+concurrent signal processing neither fights over the GIL nor starves cheap
+routes (/data/info, /data/cache) of threads:
+
+- CPU_EXECUTOR=process (default): a spawn-context ProcessPoolExecutor with
+  CPU_WORKERS workers. Workers receive the subject id and parameters only and
+  memory-map the subject's columnar store, so arrays are shared through the
+  page cache rather than pickled; results come back pickled.
+- CPU_EXECUTOR=thread: a ThreadPoolExecutor of the same size (for debugging
+  or platforms where spawning is expensive).
+
+Subjects without a fresh columnar store are always run on a thread pool of
+CPU_WORKERS threads: each process worker would otherwise unpickle the whole
+recording into a SUBJECT_CACHE of its own.
+
+Calls to a @cached_result service are answered from the result cache without
+touching the pool when possible (the lookup reads files, so it runs in a
+thread, not on the event loop), and identical concurrent calls are coalesced
+into one pool job (services/single_flight). stats() reports queue depth,
+in-flight work and worker utilisation (busy worker-seconds over available
+worker-seconds) separately for the process pool and the thread pool, each of
+which has CPU_WORKERS workers.
+"""
+import asyncio, atexit, multiprocessing, os, threading, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from services.signal_store import has_fresh_store
+from services.single_flight import AsyncSingleFlight
+
+CPU_EXECUTOR = os.environ.get("CPU_EXECUTOR", "process")
+CPU_WORKERS = max(1, int(os.environ.get("CPU_WORKERS", str(os.cpu_count() or 1))))
+
+_pool: Optional[Executor] = None
+_threads: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"cache_hits": 0}
+# Per pool kind: cpu_pool() in process mode is "process", every other pool "thread".
+_pool_stats = {
+    kind: {"submitted": 0, "completed": 0, "failed": 0, "in_flight": 0, "busy_sec": 0.0}
+    for kind in ("process", "thread")
+}
+_started = time.monotonic()
+COALESCE = AsyncSingleFlight()
+# Set by the pool initializer in every worker (process or thread). Checking
+# multiprocessing.parent_process() instead would also flag the server process
+# of `uvicorn --reload` / `--workers`, which are spawned children too.
+_worker = threading.local()
+
+
+def _mark_worker() -> None:
+    _worker.active = True
+
+
+def in_worker() -> bool:
+    """True inside a pool worker (which must not wait on the pool it runs in)."""
+    return getattr(_worker, "active", False)
+
+
+def cpu_pool() -> Executor:
+    # Spawned (not forked) workers: the server process runs threads. Workers
+    # stay up between requests, so numpy/scipy are imported once per worker.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if CPU_EXECUTOR == "thread":
+                _pool = ThreadPoolExecutor(
+                    max_workers=CPU_WORKERS, thread_name_prefix="cpu", initializer=_mark_worker
+                )
+            else:
+                _pool = ProcessPoolExecutor(
+                    max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_mark_worker,
+                )
+        return _pool
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    """Threads of this process, for subjects that only have a pickle."""
+    global _threads
+    with _pool_lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(
+                max_workers=CPU_WORKERS, thread_name_prefix="cpu-pickle", initializer=_mark_worker
+            )
+        return _threads
+
+
+def pool_for(subject: Optional[str]) -> Executor:
+    """cpu_pool(), or thread_pool() when the subject has no fresh columnar store."""
+    if CPU_EXECUTOR != "thread" and subject is not None:
+        if not has_fresh_store(f"data/WESAD/{subject}/{subject}.pkl"):
+            return thread_pool()
+    return cpu_pool()
+
+
+def reset_pool(broken: Executor) -> None:
+    """Drop a pool whose worker died; the next cpu_pool() call starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def _shutdown_pool() -> None:
+    for pool in (_pool, _threads):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _kind(pool: Executor) -> str:
+    return "process" if isinstance(pool, ProcessPoolExecutor) else "thread"
+
+
+def _count(kind: Optional[str] = None, **deltas) -> None:
+    with _stats_lock:
+        counters = _stats if kind is None else _pool_stats[kind]
+        for key, delta in deltas.items():
+            counters[key] += delta
+
+
+def _timed(func: Callable, args, kwargs):
+    # Runs in the worker; the busy time feeds the utilisation figure.
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def _prepare(func: Callable, args, kwargs):
+    """
+    (cached result, coalescing key, pool) for a call; blocking file I/O, so
+    it runs in a thread. The subject is the first argument of every
+    offloaded service.
+    """
+    peek = getattr(func, "peek", None)
+    if peek is not None:
+        cached = peek(*args, **kwargs)
+        if cached is not None:
+            return cached, None, None
+    key_of = getattr(func, "cache_key", None)
+    try:
+        args_key = key_of(*args, **kwargs) if key_of else repr((args, sorted(kwargs.items())))
+    except FileNotFoundError:
+        args_key = None
+    return None, args_key, pool_for(args[0] if args else kwargs.get("subject"))
+
+
+async def offload(func: Callable, *args, **kwargs) -> Any:
+    """
+    Await func(*args, **kwargs) on the CPU pool. func must be importable at
+    module level (it is pickled by reference). Exceptions are re-raised here.
+    """
+    cached, args_key, pool = await asyncio.to_thread(_prepare, func, args, kwargs)
+    if cached is not None:
+        _count(cache_hits=1)
+        return cached
+    if args_key is None:
+        # Unknown subject: let the worker raise it as usual.
+        return await _submit(pool, func, args, kwargs)
+
+    # Identical concurrent calls (same function and arguments) share one job.
+    key = (func.__module__, func.__qualname__, args_key)
+    return await COALESCE.run(key, lambda: _submit(pool, func, args, kwargs))
+
+
+async def _submit(pool: Executor, func: Callable, args, kwargs) -> Any:
+    kind = _kind(pool)
+    _count(kind, submitted=1, in_flight=1)
+    try:
+        result, busy = await asyncio.wrap_future(pool.submit(_timed, func, args, kwargs))
+    except BrokenProcessPool:
+        reset_pool(pool)
+        _count(kind, failed=1)
+        raise
+    except BaseException:
+        _count(kind, failed=1)
+        raise
+    finally:
+        _count(kind, in_flight=-1)
+    _count(kind, completed=1, busy_sec=busy)
+    return result
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out = dict(_stats)
+        pools = {kind: dict(counters) for kind, counters in _pool_stats.items()}
+    uptime = time.monotonic() - _started
+    for counters in pools.values():
+        counters.update({
+            "running": min(counters["in_flight"], CPU_WORKERS),
+            "queued": max(0, counters["in_flight"] - CPU_WORKERS),
+            "utilization": counters["busy_sec"] / (CPU_WORKERS * uptime) if uptime > 0 else 0.0,
+        })
+    out.update({
+        "executor": CPU_EXECUTOR,
+        "workers": CPU_WORKERS,
+        "uptime_sec": uptime,
+        "coalesced": COALESCE.coalesced,
+        **pools,
+    })
+    return out
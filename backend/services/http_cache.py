@@ -0,0 +1,146 @@
+"""
+Conditional GET for the per-subject /data endpoints.
+
+Every response of a CONDITIONAL_PATHS route is a pure function of the request
+(path, query, Accept header), the subject's source files and the backend code.
+The middleware hashes exactly those into a weak ETag before the route runs, so
+a client revalidating with If-None-Match (or If-Modified-Since) gets a 304
+after a few stat() calls: nothing is loaded, computed or serialized.
+
+Successful responses carry the ETag, Last-Modified (newest source file or code
+file) and Cache-Control: private, max-age=HTTP_CACHE_MAX_AGE (default 0, i.e.
+revalidate every time), must-revalidate. Errors are not tagged, and neither
+are responses that set their own Cache-Control (a partial health analysis is
+sent with no-store). /data/cohort is left out: its subject list is resolved
+in the route and a slow subject is reported as an error line rather than a
+failed response.
+"""
+import hashlib, json, os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.result_cache import subject_files
+from services.subject_cache import file_fingerprint
+from services.overall_data_analysis.health_analysis import HEALTH_SOURCE_FILES
+
+HTTP_CACHE_MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", "0"))
+CACHE_CONTROL = f"private, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+# The routes' default subject.
+DEFAULT_SUBJECT = "S2"
+
+CONDITIONAL_PATHS = frozenset({
+    "/data/info",
+    "/data/series",
+    "/data/heart_rate",
+    "/data/breathing_rate",
+    "/data/stress_level",
+    "/data/temperature",
+    "/data/movement",
+    "/data/pulse_transit_time",
+    "/data/skin_conductance",
+    "/data/subject_info",
+    "/data/health_analysis",
+})
+
+
+def _code_version() -> Tuple[str, int]:
+    """Digest and newest mtime (seconds) of the backend's Python sources."""
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parts, newest = [], 0
+    for folder in ("routers", "services"):
+        for root, dirs, names in os.walk(os.path.join(backend, folder)):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(names):
+                if name.endswith(".py"):
+                    st = os.stat(os.path.join(root, name))
+                    parts.append((os.path.relpath(os.path.join(root, name), backend), st.st_size, st.st_mtime_ns))
+                    newest = max(newest, st.st_mtime_ns)
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest(), newest // 1_000_000_000
+
+
+CODE_DIGEST, CODE_MTIME = _code_version()
+
+
+def validators(path: str, query: str, accept: str) -> Optional[Tuple[str, int]]:
+    """(weak ETag, Last-Modified in epoch seconds), or None for an unknown subject."""
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    subject = dict(params).get("subject", DEFAULT_SUBJECT)
+    try:
+        fingerprint = file_fingerprint(*subject_files(subject, HEALTH_SOURCE_FILES))
+    except FileNotFoundError:
+        return None
+    key = json.dumps(
+        {"path": path, "query": params, "accept": accept, "source": fingerprint, "code": CODE_DIGEST},
+        sort_keys=True,
+    )
+    mtime = max([part[1] // 1_000_000_000 for part in fingerprint if part] + [CODE_MTIME])
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"', mtime
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison: W/"x" and "x" are the same validator.
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
+def _not_modified_since(if_modified_since: str, mtime: int) -> bool:
+    try:
+        return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class ConditionalGetMiddleware:
+    def __init__(self, app, paths=CONDITIONAL_PATHS):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        found = validators(scope["path"], scope["query_string"].decode("latin-1"), request_headers.get("accept", ""))
+        if found is None:
+            await self.app(scope, receive, send)
+            return
+        etag, mtime = found
+        cache_headers = {
+            "etag": etag,
+            "last-modified": formatdate(mtime, usegmt=True),
+            "cache-control": CACHE_CONTROL,
+        }
+
+        # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110).
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            not_modified = _matches(if_none_match, etag)
+        else:
+            not_modified = _not_modified_since(request_headers.get("if-modified-since", ""), mtime)
+        if not_modified:
+            headers = MutableHeaders(cache_headers)
+            headers.append("vary", "Accept")
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_tagged(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                if "cache-control" in headers:
+                    await send(message)
+                    return
+                for name, value in cache_headers.items():
+                    headers[name] = value
+                headers.add_vary_header("Accept")
+            await send(message)
+
+        await self.app(scope, receive, send_tagged)
@@ -0,0 +1,75 @@
+"""
+JSON serialization that skips FastAPI's jsonable_encoder.
+
+Routes that return NumpyJSONResponse(content) directly are rendered in one
+pass by orjson, which writes NumPy arrays and scalars natively
+(OPT_SERIALIZE_NUMPY), so series never go through .tolist() and a per-element
+encoder walk. Without orjson (optional dependency) the stdlib encoder is used
+with the same settings as Starlette's JSONResponse.
+
+precision rounds every float (array values included) to that many decimals
+before encoding; the shape of the response is unchanged. NaN is written as
+null by orjson, while the stdlib fallback refuses it, like Starlette does.
+"""
+import json
+from typing import Any, Optional
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def round_floats(value: Any, precision: int) -> Any:
+    """Copy of value with floats (and float arrays) rounded to precision decimals."""
+    if isinstance(value, np.ndarray):
+        return np.round(value, precision) if value.dtype.kind == "f" else value
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), precision)
+    if isinstance(value, dict):
+        return {k: round_floats(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round(v, precision) if type(v) is float else round_floats(v, precision) for v in value]
+    return value
+
+
+def _orjson_default(value: Any) -> Any:
+    # Called for what orjson cannot write itself: strided views are copied,
+    # arrays of other dtypes become lists.
+    if isinstance(value, np.ndarray):
+        return value.tolist() if value.flags.c_contiguous else np.ascontiguousarray(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_default(value: Any) -> Any:
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any, precision: Optional[int] = None) -> bytes:
+    """UTF-8 JSON of content, which may hold NumPy arrays and scalars."""
+    if precision is not None:
+        content = round_floats(content, precision)
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        content, default=_stdlib_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class NumpyJSONResponse(JSONResponse):
+    def __init__(self, content: Any, precision: Optional[int] = None, **kwargs):
+        # render() runs inside JSONResponse.__init__.
+        self.precision = precision
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content, self.precision)
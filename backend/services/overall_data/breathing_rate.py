@@ -1,126 +1,95 @@
+import math
+
 import numpy as np
-from scipy.signal import butter, filtfilt, find_peaks
-from typing import Dict, List
+from typing import Dict
 
-from services.pkl_loader import load_pkl, DEFAULT_FS
+from services.pkl_loader import load_pkl
+from services.result_cache import cached_result
+from services.time_range import clip_result, sample_range
+from services.overall_data.fiducials import BREATH_PEAKS, peak_times
 
-BREATHING_BAND = [0.1, 0.5]
+BREATHING_BAND = BREATH_PEAKS["band"]
 RESP_FS = 700
 
 
-def _butter_bandpass_filter(data, lowcut, highcut, fs, order=2):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype="band")
-    y = filtfilt(b, a, data)
-    return y
-
-
-def process_respiration_signal(
-    raw_signal: List[float], fs: int = RESP_FS, winsec: int = 15, step_sec: int = 5
+def breathing_rates_from_peaks(
+    peaks: np.ndarray, duration_sec: float, winsec: float = 15, step_sec: float = 5, from_sec: float = 0.0
 ) -> Dict[float, float]:
     """
-    Calculates the breathing rate over time from a raw respiration signal.
-
-    Strategy:
-     - Filter the full signal
-     - Detect peaks once for the entire signal
-     - For each timestep (every step_sec seconds), compute rate from:
+    Breathing rate every step_sec seconds from breath peak times (seconds from
+    the start of a duration_sec long recording):
          1) the mean inter-peak interval inside the window (preferred)
          2) if only one peak inside window: estimate using nearest peak before+after
          3) fallback: count-based estimate (num_peaks/window_duration * 60)
     This gives fractional BPM values instead of only integer multiples produced by simple counting.
+
+    All windows are evaluated at once: searchsorted gives the first/last peak
+    of every window, and the mean interval is the span between them divided by
+    the interval count (the interval prefix sum telescopes), so the cost does
+    not grow with winsec / step_sec.
+
+    Windows end at multiples of step_sec (fractions allowed) from the recording
+    start; with from_sec only those ending at or after from_sec are built, so
+    a ranged request lands on the same grid as the full recording.
     """
-    sig = np.array(raw_signal)
-    sig = sig.flatten()
+    peaks = np.asarray(peaks, dtype=np.float64)
+    if duration_sec <= 0 or duration_sec < step_sec:
+        return {0.0: 0.0}
 
-    try:
-        filtered_sig = _butter_bandpass_filter(
-            sig, BREATHING_BAND[0], BREATHING_BAND[1], fs
+    last_t = int(duration_sec)
+    # The epsilon keeps e.g. 3 / 0.1 = 29.999... from dropping the last window.
+    first = max(1, math.ceil(from_sec / step_sec - 1e-9))
+    t_sec = step_sec * np.arange(first, math.floor(last_t / step_sec + 1e-9) + 1)
+    start_sec = np.maximum(0.0, t_sec - winsec)
+    window_duration_sec = t_sec - start_sec
+    ok = window_duration_sec > 0
+    t_sec, start_sec, window_duration_sec = t_sec[ok], start_sec[ok], window_duration_sec[ok]
+
+    # Peaks inside [start, end] (both inclusive) are peaks[lo:hi].
+    lo = np.searchsorted(peaks, start_sec, side="left")
+    hi = np.searchsorted(peaks, t_sec, side="right")
+    count = hi - lo
+    rate_bpm = np.zeros(t_sec.size)
+
+    many = count >= 2
+    span = peaks[hi[many] - 1] - peaks[lo[many]]
+    rate_bpm[many] = 60.0 / (span / (count[many] - 1))
+
+    # One peak: use the neighbouring peaks around it (before and after when
+    # both exist, otherwise whichever side does).
+    one = np.flatnonzero(count == 1)
+    if one.size:
+        idx = lo[one]
+        n_peaks = peaks.size
+        has_before = idx - 1 >= 0
+        has_after = idx + 1 < n_peaks
+        single = peaks[idx]
+        before = peaks[np.maximum(idx - 1, 0)]
+        after = peaks[np.minimum(idx + 1, n_peaks - 1)]
+        interval = np.where(
+            has_before & has_after, after - before,
+            np.where(has_before, single - before, np.where(has_after, after - single, 0.0)),
         )
-    except ValueError:
-        return {0.0: 0.0}
+        rate_bpm[one] = np.divide(60.0, interval, out=np.zeros(one.size), where=interval > 0)
 
-    win_samples = int(winsec * fs)
-    step_samples = int(step_sec * fs)
-    total_samples = len(filtered_sig)
+    # Count-based fallback wherever no interval estimate was possible.
+    fallback = rate_bpm == 0.0
+    rate_bpm[fallback] = count[fallback] / window_duration_sec[fallback] * 60.0
 
-    rates: Dict[float, float] = {}
+    return {float(t): float(r) for t, r in zip(t_sec, rate_bpm)}
 
-    if total_samples < step_samples or total_samples == 0:
-        return {0.0: 0.0}
 
-    min_distance = max(1, int(fs * 0.5))
-    peaks, _ = find_peaks(filtered_sig, distance=min_distance)
-
-    peaks = np.array(peaks, dtype=int)
-
-    def rate_from_intervals(intervals_sec: np.ndarray) -> float:
-        if len(intervals_sec) == 0:
-            return 0.0
-        mean_interval = float(np.mean(intervals_sec))
-        if mean_interval <= 0:
-            return 0.0
-        return 60.0 / mean_interval
-
-    step_sec_safe = max(1, step_sec)
-    last_t = int(total_samples / fs)
-    for t_sec in range(step_sec_safe, last_t + 1, step_sec_safe):
-        end_sample = int(t_sec * fs)
-        start_sample = max(0, end_sample - win_samples)
-        window_duration_sec = (end_sample - start_sample) / fs if fs > 0 else 0
-
-        if window_duration_sec <= 0:
-            continue
-
-        peaks_in_window = peaks[(peaks >= start_sample) & (peaks <= end_sample)]
-
-        rate_bpm = 0.0
-
-        if len(peaks_in_window) >= 2:
-            diffs = np.diff(peaks_in_window).astype(float) / fs
-            rate_bpm = rate_from_intervals(diffs)
-        elif len(peaks_in_window) == 1:
-            single_peak = peaks_in_window[0]
-            idx = np.searchsorted(peaks, single_peak)
-
-            before_idx = idx - 1
-            after_idx = (
-                idx + 0
-            )
-
-            if before_idx >= 0 and (idx + 1) < len(peaks):
-                interval_sec = (peaks[idx + 1] - peaks[before_idx]) / fs
-                if interval_sec > 0:
-                    rate_bpm = 60.0 / interval_sec
-                else:
-                    rate_bpm = 0.0
-            else:
-                if before_idx >= 0:
-                    interval_sec = (single_peak - peaks[before_idx]) / fs
-                    if interval_sec > 0:
-                        rate_bpm = 60.0 / interval_sec
-                elif (idx + 1) < len(peaks):
-                    interval_sec = (peaks[idx + 1] - single_peak) / fs
-                    if interval_sec > 0:
-                        rate_bpm = 60.0 / interval_sec
-                else:
-                    rate_bpm = 0.0
-
-        if rate_bpm == 0.0:
-            num_peaks = len(peaks_in_window)
-            rate_bpm = (num_peaks / window_duration_sec) * 60.0
-
-        rates[float(t_sec)] = float(rate_bpm)
-
-    return rates
-
-
-def get_breathing_rate(subject: str, winsec: int = 5, step_sec: int = 5) -> Dict:
+@cached_result(version=2)
+def get_breathing_rate(
+    subject: str,
+    winsec: float = 5,
+    step_sec: float = 5,
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+) -> Dict:
     """
-    Load the subject pkl, extract chest RESP signal, compute breathing rates using
-    process_respiration_signal and return a JSON-serializable dict:
+    Load the subject pkl, take the chest RESP breath peaks from the fiducial
+    cache, compute breathing rates with breathing_rates_from_peaks and return a JSON-serializable dict:
     {
       "x_label": "Time (s)",
       "y_label": "Breathrate (BPM)",
@@ -128,42 +97,33 @@ def get_breathing_rate(subject: str, winsec: int = 5, step_sec: int = 5) -> Dict
       "y_values": [...]
     }
 
+    Peaks are detected once over the whole recording (see fiducials), so
+    with start_sec/end_sec only the windows around that range are built, on
+    the same step_sec grid as the full recording.
+
     Raises FileNotFoundError if subject file not found.
     Raises KeyError if RESP signal not present.
     """
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    chest_data = obj["signal"]["chest"]
-
-    resp_key = None
-    for key in chest_data.keys():
-        if key.upper() == "RESP":
-            resp_key = key
-            break
+    # KeyError if the chest RESP block is missing.
+    n = obj.meta("chest", "RESP")["shape"][0]
+    fs = obj.sampling_rate("chest", "RESP", default=RESP_FS)
 
-    if resp_key is None:
-        raise KeyError("RESP key not found in chest data")
+    i0, i1 = sample_range(n, fs, start_sec, end_sec, pad_sec=winsec)
+    t0, t1 = i0 / fs, i1 / fs
+    # One window of extra peaks on each side for the single-peak neighbour estimate.
+    peaks = peak_times(obj, "chest", "RESP", BREATH_PEAKS, max(0.0, t0 - winsec), t1 + winsec)
 
-    payload = chest_data[resp_key]
-
-    if isinstance(payload, dict) and "signal" in payload:
-        raw_signal = payload["signal"]
-        fs = payload.get("sampling_rate") or DEFAULT_FS.get("RESP", RESP_FS)
-    else:
-        raw_signal = payload
-        fs = DEFAULT_FS.get("RESP", RESP_FS)
-
-    rates_dict = process_respiration_signal(
-        raw_signal, fs=fs, winsec=winsec, step_sec=step_sec
-    )
+    rates_dict = breathing_rates_from_peaks(peaks, t1, winsec=winsec, step_sec=step_sec, from_sec=t0)
 
     x_values = list(rates_dict.keys())
     y_values = list(rates_dict.values())
 
-    return {
+    return clip_result({
         "x_label": "Time (s)",
         "y_label": "Breathrate (BPM)",
         "x_values": x_values,
         "y_values": y_values,
-    }
+    }, 0.0, start_sec, end_sec)
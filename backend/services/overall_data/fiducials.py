@@ -0,0 +1,152 @@
+"""
+Fiducial points (R-peaks, pulse peaks, breath peaks) computed once per subject.
+
+A detector is a small dict of parameters (band, working rate, minimum spacing,
+prominence or height threshold). peak_indices() runs it over the whole
+recording of one sensor/modality, keeps the result as int32 sample indices at
+the signal's own rate, and reuses it for every later request:
+
+- in memory, as an entry of SUBJECT_CACHE keyed by subject, signal and
+  detector parameters, invalidated with the subject's fingerprint;
+- on disk, in data/WESAD/S2/S2_fiducials/<sensor>_<modality>_<params hash>.npy
+  plus a .json sidecar recording the parameters and the source fingerprint, so
+  other workers and restarts skip detection too.
+
+Metrics query them by time range with peak_times(), or by sample range with
+peak_range().
+"""
+import hashlib, json, os
+from typing import Any, Dict, Optional
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from services.pkl_loader import SUBJECT_CACHE, SubjectData
+from services.overall_data.preprocessing import ECG_TARGET_FS, RESP_TARGET_FS, prepare
+
+FIDUCIAL_VERSION = 1
+FIDUCIAL_SUFFIX = "_fiducials"
+
+# ECG R-peaks (heart rate, PTT).
+R_PEAKS = {"band": (5.0, 15.0), "target_fs": ECG_TARGET_FS, "min_dist_sec": 0.4, "prominence_std": 0.5}
+# BVP systolic peaks for heart rate.
+PULSE_PEAKS = {"band": (0.5, 8.0), "target_fs": None, "min_dist_sec": 0.4, "prominence_std": 0.5}
+# BVP peaks as used for pulse arrival in PTT.
+PTT_PULSE_PEAKS = {"band": (0.83, 3.0), "target_fs": None, "min_dist_sec": 0.35, "height": 0.0}
+# Inhalation peaks of chest RESP.
+BREATH_PEAKS = {"band": (0.1, 0.5), "target_fs": RESP_TARGET_FS, "min_dist_sec": 0.5}
+# No filtering, for modalities without a known band.
+RAW_PEAKS = {"band": None, "target_fs": None, "min_dist_sec": 0.4, "prominence_std": 0.5}
+
+
+def detect_peaks(signal, fs: float, detector: Dict[str, Any]) -> np.ndarray:
+    """
+    Run a detector over an array. Returns peak times in seconds. A signal that
+    is too short to filter is searched unfiltered, like RAW_PEAKS.
+    """
+    sig = np.asarray(signal, dtype=np.float64).reshape(-1)
+    work_fs = float(fs)
+    if detector.get("band") is not None:
+        try:
+            sig, work_fs = prepare(sig, fs, detector["band"], target_fs=detector.get("target_fs"))
+        except ValueError:
+            pass
+    if sig.size == 0:
+        return np.empty(0, dtype=np.float64)
+    kwargs = {"distance": max(1, int(work_fs * detector["min_dist_sec"]))}
+    if detector.get("prominence_std") is not None:
+        kwargs["prominence"] = np.std(sig) * detector["prominence_std"]
+    if detector.get("height") is not None:
+        kwargs["height"] = detector["height"]
+    peaks, _ = find_peaks(sig, **kwargs)
+    return peaks / work_fs
+
+
+def fiducial_dir(pkl_path: str) -> str:
+    return os.path.splitext(pkl_path)[0] + FIDUCIAL_SUFFIX
+
+
+def _params(sensor: str, modality: str, fs: float, detector: Dict[str, Any]) -> Dict[str, Any]:
+    return json.loads(json.dumps({
+        "version": FIDUCIAL_VERSION, "sensor": sensor, "modality": modality.upper(),
+        "fs": fs, "detector": detector,
+    }, sort_keys=True))
+
+
+def _file_stem(params: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{params['sensor']}_{params['modality']}_{digest}"
+
+
+def _read_persisted(stem: str, params: Dict[str, Any], source) -> Optional[np.ndarray]:
+    try:
+        with open(stem + ".json", "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if sidecar.get("params") != params or sidecar.get("source") != source:
+            return None
+        return np.load(stem + ".npy")
+    except (OSError, ValueError):
+        return None
+
+
+def _persist(stem: str, params: Dict[str, Any], source, indices: np.ndarray) -> None:
+    # Best effort: a read-only data folder only costs the on-disk reuse.
+    try:
+        os.makedirs(os.path.dirname(stem), exist_ok=True)
+        np.save(stem + ".npy", indices)
+        tmp_path = stem + ".json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "source": source, "count": int(indices.size)}, f)
+        os.replace(tmp_path, stem + ".json")
+    except OSError:
+        pass
+
+
+def peak_indices(obj: SubjectData, sensor: str, modality: str, detector: Dict[str, Any]) -> np.ndarray:
+    """int32 sample indices (at the signal's rate) of every peak in the recording."""
+    fs = float(obj.sampling_rate(sensor, modality))
+    params = _params(sensor, modality, fs, detector)
+    stem = os.path.join(fiducial_dir(obj.path), _file_stem(params))
+    source = json.loads(json.dumps(obj.fingerprint))
+
+    def load():
+        indices = _read_persisted(stem, params, source)
+        if indices is None:
+            times = detect_peaks(obj.signal(sensor, modality), fs, detector)
+            indices = np.round(times * fs).astype(np.int32)
+            _persist(stem, params, source, indices)
+        return indices
+
+    key = (obj.path, "fiducials", sensor, modality.upper(), json.dumps(params, sort_keys=True))
+    return SUBJECT_CACHE.get_or_load(key, obj.fingerprint, load)
+
+
+def peak_range(
+    obj: SubjectData,
+    sensor: str,
+    modality: str,
+    detector: Dict[str, Any],
+    i0: Optional[int] = None,
+    i1: Optional[int] = None,
+) -> np.ndarray:
+    """Peak sample indices within [i0, i1) (open ends by default)."""
+    indices = peak_indices(obj, sensor, modality, detector)
+    lo = 0 if i0 is None else np.searchsorted(indices, i0, side="left")
+    hi = indices.size if i1 is None else np.searchsorted(indices, i1, side="left")
+    return indices[lo:hi]
+
+
+def peak_times(
+    obj: SubjectData,
+    sensor: str,
+    modality: str,
+    detector: Dict[str, Any],
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+) -> np.ndarray:
+    """Peak times in seconds within [start_sec, end_sec) (open ends by default)."""
+    fs = float(obj.sampling_rate(sensor, modality))
+    indices = peak_indices(obj, sensor, modality, detector)
+    lo = 0 if start_sec is None else np.searchsorted(indices, start_sec * fs, side="left")
+    hi = indices.size if end_sec is None else np.searchsorted(indices, end_sec * fs, side="left")
+    return indices[lo:hi] / fs
@@ -1,45 +1,95 @@
 import numpy as np
-from scipy.signal import find_peaks
-from services.pkl_loader import load_pkl, extract_series
+from services.pkl_loader import load_pkl
+from services.result_cache import cached_result
+from services.time_range import clip_result, sample_range
+from services.overall_data.windowing import window_length
+from services.overall_data.fiducials import PULSE_PEAKS, R_PEAKS, RAW_PEAKS, peak_range
 
-def compute_heart_rate(y_values, fs: float, window_sec: float = 5.0):
+WINDOW_SEC = 5.0
+# Beat detectors per source: QRS energy for ECG, the pulse wave for BVP.
+BEAT_DETECTORS = {"ECG": R_PEAKS, "BVP": PULSE_PEAKS}
+# Beat-to-beat values outside this range are missed or spurious peaks.
+BEAT_BPM_RANGE = (30.0, 220.0)
+MODES = ("window", "beat")
+
+
+def heart_rate_from_beats(
+    beats: np.ndarray,
+    n: int,
+    fs: float,
+    window_sec: float = WINDOW_SEC,
+    step_sec: float | None = None,
+    mode: str = "window",
+):
     """
-    Compute heart rate (BPM) from ECG or BVP values using peak detection.
-    Each HR value is assigned to the **end of the window**.
+    Heart rate from beat sample indices (counted from the first of n samples
+    at fs).
+
+    mode="window": (beats - 1) / (last beat - first beat) per window, assigned
+    to the **end of the window**; windows start every step_sec (default
+    window_sec, smaller values overlap) and need at least two beats.
+    mode="beat": instantaneous 60 / RR at every beat, timestamped at the beat.
+
+    Beats are assigned to windows in whole samples with searchsorted, so a
+    beat on a window edge lands in the same window whatever the offset of the
+    samples, and the cost is O(windows log beats).
     """
-    signal = np.asarray(y_values)
-    if signal.ndim > 1:
-        signal = signal.flatten()
-
-    peaks, _ = find_peaks(signal, distance=fs*0.4, prominence=np.std(signal)*0.5)
-
-    hr_times, hr_values = [], []
-    window = int(window_sec * fs)
-    for i in range(0, len(signal) - window, window):
-        window_peaks = peaks[(peaks >= i) & (peaks < i + window)]
-        if len(window_peaks) >= 2:
-            duration = (window_peaks[-1] - window_peaks[0]) / fs
-            hr = (len(window_peaks) - 1) / duration * 60.0
-            hr_times.append((i + window) / fs) 
-            hr_values.append(hr)
+    if mode not in MODES:
+        raise ValueError(f"Unknown heart rate mode: {mode} (expected one of {', '.join(MODES)})")
+
+    beats = np.asarray(beats, dtype=np.int64)
+    if mode == "beat":
+        times = beats / fs
+        bpm = 60.0 / np.diff(times) if times.size > 1 else np.empty(0)
+        keep = (bpm >= BEAT_BPM_RANGE[0]) & (bpm <= BEAT_BPM_RANGE[1])
+        hr_times, hr_values = times[1:][keep], bpm[keep]
+    else:
+        window = window_length(window_sec, fs)
+        step = window_length(step_sec or window_sec, fs)
+        starts = np.arange(0, max(0, n - window + 1), step, dtype=np.int64)
+        lo = np.searchsorted(beats, starts, side="left")
+        hi = np.searchsorted(beats, starts + window, side="left")
+        ok = hi - lo >= 2
+        first, last = beats[lo[ok]] / fs, beats[hi[ok] - 1] / fs
+        hr_times = (starts[ok] + window) / fs
+        hr_values = (hi[ok] - lo[ok] - 1) / (last - first) * 60.0
 
     return {
         "x_label": "Time (s)",
         "y_label": "Heartrate (BPM)",
-        "x_values": hr_times,
-        "y_values": hr_values
+        "x_values": hr_times.astype(np.float64),
+        "y_values": hr_values.astype(np.float64),
     }
 
-def get_heart_rate(subject: str, sensor: str = "chest", modality: str = "ECG"):
+
+@cached_result(version=3)
+def get_heart_rate(
+    subject: str,
+    sensor: str = "chest",
+    modality: str = "ECG",
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    window_sec: float = WINDOW_SEC,
+    step_sec: float | None = None,
+    mode: str = "window",
+):
+    """
+    Beats come from the subject's fiducial cache (detected once over the whole
+    recording); only the windows overlapping the requested range are built.
+    """
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    series = extract_series(obj, sensor=sensor, modality=modality)
+    # DEFAULT_FS fallback: 700 Hz for chest ECG, 64 Hz for wrist BVP.
+    fs = obj.sampling_rate(sensor, modality)
+    n = obj.meta(sensor, modality)["shape"][0]
 
-    payload = obj["signal"][sensor][modality]
-    if isinstance(payload, dict):
-        fs = payload.get("sampling_rate", 700)
-    else:
-        fs = 700 
+    # Pad by one window so edge windows (and the first beat's RR) are complete.
+    i0, i1 = sample_range(
+        n, fs, start_sec, end_sec, pad_sec=window_sec, align_sec=step_sec or window_sec
+    )
+    detector = BEAT_DETECTORS.get(modality.upper(), RAW_PEAKS)
+    beats = peak_range(obj, sensor, modality, detector, i0, i1) - i0
 
-    return compute_heart_rate(series["y_values"], fs)
+    result = heart_rate_from_beats(beats, i1 - i0, fs, window_sec=window_sec, step_sec=step_sec, mode=mode)
+    return clip_result(result, i0 / fs, start_sec, end_sec)
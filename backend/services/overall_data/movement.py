@@ -1,42 +1,41 @@
-import numpy as np
-from services.pkl_loader import load_pkl, extract_series
+from services.pkl_loader import load_pkl, extract_array
+from services.result_cache import cached_result
+from services.time_range import clip_result
+from services.overall_data.windowing import windowed_series
 
-def compute_movement(y_values, fs: float, window_sec: float = 5.0):
+WINDOW_SEC = 5.0
+
+def compute_movement(y_values, fs: float, window_sec: float = WINDOW_SEC, step_sec: float | None = None):
     """
     Compute average movement intensity from precomputed ACC magnitude.
     """
-    sig = np.asarray(y_values, dtype=float).flatten()
-
-    win = int(window_sec * fs)
-    times, vals = [], []
-
-    for i in range(0, len(sig) - win + 1, win):
-        window = sig[i : i + win]
-        times.append((i + win) / fs)
-        vals.append(float(np.nanmean(window)))
-
-    return {
-        "x_label": "Time (s)",
-        "y_label": "Movement intensity (g)",
-        "x_values": times,
-        "y_values": vals,
-    }
-
-def get_movement(subject: str, sensor: str = "wrist", modality: str = "ACC"):
+    return windowed_series(
+        y_values, fs, "Time (s)", "Movement intensity (g)", window_sec=window_sec, step_sec=step_sec
+    )
+
+@cached_result(version=3)
+def get_movement(
+    subject: str,
+    sensor: str = "wrist",
+    modality: str = "ACC",
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    window_sec: float = WINDOW_SEC,
+    step_sec: float | None = None,
+):
     """
-    Load accelerometer data (already magnitude via extract_series)
-    and compute movement intensity per 5s window.
+    Load accelerometer data (already magnitude via extract_array)
+    and compute movement intensity per window (default 5s).
     """
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    series = extract_series(obj, sensor=sensor, modality=modality, stride=1, limit=None)
+    fs = float(obj.sampling_rate(sensor, modality, default=32.0))
 
-    payload_block = obj["signal"][sensor]
-    payload = payload_block.get(modality)
-    if isinstance(payload, dict):
-        fs = float(payload.get("sampling_rate", 32.0))
-    else:
-        fs = 32.0
+    series = extract_array(
+        obj, sensor=sensor, modality=modality, start_sec=start_sec, end_sec=end_sec,
+        pad_sec=window_sec, align_sec=step_sec or window_sec, fs=fs,
+    )
 
-    return compute_movement(series["y_values"], fs)
\ No newline at end of file
+    result = compute_movement(series["y_values"], fs, window_sec=window_sec, step_sec=step_sec)
+    return clip_result(result, series["t0"], start_sec, end_sec)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Shared filtering front end for the beat/breath detectors.
+
+Chest signals are stored at 700 Hz, far above what their analysis bands need
+(RESP: 0.1-0.5 Hz, ECG QRS: 5-15 Hz). prepare() first decimates with an
+anti-aliased polyphase FIR (resample_poly) to a rate chosen per metric, then
+band-passes with a zero-phase second-order-sections filter. SOS designs stay
+numerically stable at low normalised cut-offs where b/a designs do not, and
+are cached per (band, fs, order) so repeated requests do not redesign them.
+
+Sample k of the output is at time k / fs_out, like the input, so peak indices
+convert to seconds with the returned rate.
+"""
+from fractions import Fraction
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.signal import butter, resample_poly, sosfiltfilt
+
+# Working rates per metric (None keeps the native rate).
+RESP_TARGET_FS = 25.0
+ECG_TARGET_FS = 140.0
+FILTER_ORDER = 2
+
+
+@lru_cache(maxsize=64)
+def sos_design(band: Tuple[float, float], fs: float, order: int = FILTER_ORDER) -> np.ndarray:
+    """Band-pass Butterworth design as second-order sections."""
+    return butter(order, band, btype="band", fs=fs, output="sos")
+
+
+def decimate(signal: np.ndarray, fs: float, target_fs: Optional[float]) -> Tuple[np.ndarray, float]:
+    """
+    Anti-aliased polyphase resampling down to target_fs (rational ratio).
+    Signals already at or below target_fs are returned unchanged.
+    """
+    sig = np.asarray(signal, dtype=np.float64).reshape(-1)
+    if not target_fs or target_fs >= fs or sig.size == 0:
+        return sig, float(fs)
+    ratio = Fraction(target_fs / fs).limit_denominator(1000)
+    out = resample_poly(sig, ratio.numerator, ratio.denominator, padtype="line")
+    return out, float(fs) * ratio.numerator / ratio.denominator
+
+
+def bandpass(signal: np.ndarray, band: Tuple[float, float], fs: float, order: int = FILTER_ORDER) -> np.ndarray:
+    """
+    Zero-phase band-pass. Raises ValueError when the band does not fit below
+    Nyquist or the signal is too short to filter (as filtfilt did).
+    """
+    if not 0 < band[0] < band[1] < fs / 2:
+        raise ValueError(f"band {band} Hz does not fit below Nyquist at {fs} Hz")
+    return sosfiltfilt(sos_design(tuple(band), float(fs), order), np.asarray(signal, dtype=np.float64))
+
+
+def prepare(
+    signal: np.ndarray,
+    fs: float,
+    band: Tuple[float, float],
+    target_fs: Optional[float] = None,
+    order: int = FILTER_ORDER,
+) -> Tuple[np.ndarray, float]:
+    """Decimate to target_fs, then band-pass. Returns (filtered, fs_out)."""
+    sig, fs_out = decimate(signal, fs, target_fs)
+    return bandpass(sig, band, fs_out, order), fs_out
@@ -1,98 +1,78 @@
+import math
+
 import numpy as np
-from scipy.signal import butter, filtfilt, find_peaks
-from typing import Dict, List, Any
+from typing import Dict, Any
 
-from services.pkl_loader import load_pkl, DEFAULT_FS
+from services.pkl_loader import load_pkl
+from services.result_cache import cached_result
+from services.time_range import clip_result
+from services.overall_data.fiducials import PTT_PULSE_PEAKS, R_PEAKS, peak_times
 
 ECG_FS = 700
 BVP_FS = 64
 
-BVP_BAND = [0.83, 3.0]
-ECG_BAND = [5.0, 15.0]
-
-
-def _butter_bandpass_filter(data, lowcut, highcut, fs, order=2):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype="band")
-    y = filtfilt(b, a, data)
-    return y
-
+# Physiologically plausible R-peak to pulse-peak delays.
+PTT_RANGE_MS = (20.0, 800.0)
 
-def _find_all_peaks(signal: np.ndarray, fs: int, band: List[float], min_dist_sec: float) -> np.ndarray:
-    """Filter a signal and find peaks. Returns sample indices of peaks."""
-    try:
-        filtered = _butter_bandpass_filter(signal, band[0], band[1], fs)
-    except ValueError:
-        return np.array([], dtype=int)
 
-    distance = max(1, int(fs * min_dist_sec))
-    peaks, _ = find_peaks(filtered, height=0, distance=distance)
-    return np.array(peaks, dtype=int)
+def pair_ptt(ecg_times: np.ndarray, bvp_times: np.ndarray):
+    """
+    Pair every R-peak with the first BVP peak strictly after it and keep the
+    pairs whose delay lies within PTT_RANGE_MS. Returns (R-peak times, PTT ms).
+    """
+    nxt = np.searchsorted(bvp_times, ecg_times, side="right")
+    has_next = nxt < bvp_times.size
+    t_ecg = ecg_times[has_next]
+    ptt_ms = (bvp_times[nxt[has_next]] - t_ecg) * 1000.0
+    gate = (ptt_ms > PTT_RANGE_MS[0]) & (ptt_ms < PTT_RANGE_MS[1])
+    return t_ecg[gate], ptt_ms[gate]
 
 
-def _compute_ptt_from_signals(
-    raw_ecg: List[float],
-    raw_bvp: List[float],
-    ecg_fs: int,
-    bvp_fs: int,
-    winsec: int,
-    step_sec: int,
+def _compute_ptt_from_times(
+    ecg_times: np.ndarray, bvp_times: np.ndarray, winsec: float, step_sec: float
 ) -> Dict[float, float]:
-    """Core PTT computation: returns dict {timestamp_sec: mean_ptt_ms_in_window}."""
-
-    ecg_sig = np.array(raw_ecg).flatten()
-    bvp_sig = np.array(raw_bvp).flatten()
-
-    ecg_peaks_idx = _find_all_peaks(ecg_sig, ecg_fs, ECG_BAND, min_dist_sec=0.35)
-    bvp_peaks_idx = _find_all_peaks(bvp_sig, bvp_fs, BVP_BAND, min_dist_sec=0.35)
+    """
+    Core PTT computation from R-peak and BVP peak times (seconds): returns dict
+    {timestamp_sec: mean_ptt_ms_in_window}.
 
-    if ecg_peaks_idx.size == 0 or bvp_peaks_idx.size == 0:
+    Windows [end - winsec, end) end every step_sec (fractions allowed); a
+    window without pairs repeats the previous window's value (0.0 before the
+    first one). Window sums come from one cumulative sum over the PTT series,
+    so the cost is linear in the number of beats plus windows.
+    """
+    if ecg_times.size == 0 or bvp_times.size == 0:
         return {0.0: 0.0}
 
-    ecg_times = ecg_peaks_idx / float(ecg_fs)
-    bvp_times = bvp_peaks_idx / float(bvp_fs)
-
-    ptt_values = []
-    ptt_timestamps = []
-
-    bvp_idx = 0
-    for t_ecg in ecg_times:
-        while bvp_idx < len(bvp_times) and bvp_times[bvp_idx] <= t_ecg:
-            bvp_idx += 1
-        if bvp_idx >= len(bvp_times):
-            break
-        t_bvp = bvp_times[bvp_idx]
-        ptt_ms = (t_bvp - t_ecg) * 1000.0
-        if 20.0 < ptt_ms < 800.0:
-            ptt_values.append(ptt_ms)
-            ptt_timestamps.append(t_ecg)
-
-    if not ptt_values:
+    ptt_timestamps, ptt_values = pair_ptt(ecg_times, bvp_times)
+    if ptt_values.size == 0:
         return {0.0: 0.0}
 
-    results: Dict[float, float] = {}
-    total_duration = int(max(ptt_timestamps))
+    total_duration = int(ptt_timestamps[-1])
+    # The epsilon keeps e.g. 3 / 0.1 = 29.999... from dropping the last window.
+    end_time = step_sec * np.arange(1, math.floor(total_duration / step_sec + 1e-9) + 1)
+    start_time = np.maximum(0.0, end_time - winsec)
 
-    step_sec_safe = max(1, step_sec)
-    for t_sec in range(step_sec_safe, total_duration + 1, step_sec_safe):
-        end_time = float(t_sec)
-        start_time = max(0.0, end_time - winsec)
-        window_vals = [
-            ptt_values[i]
-            for i, ts in enumerate(ptt_timestamps)
-            if start_time <= ts < end_time
-        ]
-        if window_vals:
-            results[end_time] = float(np.mean(window_vals))
-        else:
-            results[end_time] = float(list(results.values())[-1]) if results else 0.0
+    lo = np.searchsorted(ptt_timestamps, start_time, side="left")
+    hi = np.searchsorted(ptt_timestamps, end_time, side="left")
+    csum = np.concatenate([[0.0], np.cumsum(ptt_values)])
+    count = hi - lo
+    means = (csum[hi] - csum[lo]) / np.maximum(count, 1)
 
-    return results
+    # Forward-fill empty windows from the last non-empty one.
+    last = np.maximum.accumulate(np.where(count > 0, np.arange(count.size), -1))
+    values = np.where(last >= 0, means[np.maximum(last, 0)], 0.0)
 
+    return {float(t): float(v) for t, v in zip(end_time, values)}
 
-def get_pulse_transit_time(subject: str, winsec: int = 5, step_sec: int = 5) -> Dict[str, Any]:
+
+@cached_result(version=2)
+def get_pulse_transit_time(
+    subject: str,
+    winsec: float = 5,
+    step_sec: float = 5,
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+) -> Dict[str, Any]:
     """
     Load .pkl for subject, extract ECG (chest) and BVP (wrist), compute PTT windows.
     Returns a JSON-serializable dict:
@@ -110,50 +90,24 @@ def get_pulse_transit_time(subject: str, winsec: int = 5, step_sec: int = 5) ->
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path) 
 
-    chest = obj["signal"]["chest"]
-    ecg_key = None
-    for k in chest.keys():
-        if k.upper() == "ECG":
-            ecg_key = k
-            break
-    if ecg_key is None:
-        raise KeyError("ECG key not found")
-
-    ecg_payload = chest[ecg_key]
-    if isinstance(ecg_payload, dict) and "signal" in ecg_payload:
-        raw_ecg = ecg_payload["signal"]
-        ecg_fs = ecg_payload.get("sampling_rate") or DEFAULT_FS.get("ECG", ECG_FS)
-    else:
-        raw_ecg = ecg_payload
-        ecg_fs = DEFAULT_FS.get("ECG", ECG_FS)
-
-    wrist = obj["signal"]["wrist"]
-    bvp_key = None
-    for k in wrist.keys():
-        if k.upper() == "BVP":
-            bvp_key = k
-            break
-    if bvp_key is None:
-        raise KeyError("BVP key not found")
-
-    bvp_payload = wrist[bvp_key]
-    if isinstance(bvp_payload, dict) and "signal" in bvp_payload:
-        raw_bvp = bvp_payload["signal"]
-        bvp_fs = bvp_payload.get("sampling_rate") or DEFAULT_FS.get("BVP", BVP_FS)
-    else:
-        raw_bvp = bvp_payload
-        bvp_fs = DEFAULT_FS.get("BVP", BVP_FS)
-
-    ptt_dict = _compute_ptt_from_signals(
-        raw_ecg, raw_bvp, ecg_fs=int(ecg_fs), bvp_fs=int(bvp_fs), winsec=winsec, step_sec=step_sec
-    )
+    obj.meta("chest", "ECG")  # KeyError if ECG is missing
+    obj.meta("wrist", "BVP")  # KeyError if BVP is missing
+
+    # R-peaks and BVP peaks come from the fiducial cache. Pairing and
+    # windowing are O(beats + windows), and the forward fill of empty windows
+    # depends on everything before the range, so the whole recording is
+    # windowed and a time range only clips the result.
+    ecg_times = peak_times(obj, "chest", "ECG", R_PEAKS)
+    bvp_times = peak_times(obj, "wrist", "BVP", PTT_PULSE_PEAKS)
+
+    ptt_dict = _compute_ptt_from_times(ecg_times, bvp_times, winsec=winsec, step_sec=step_sec)
 
     x_values = list(ptt_dict.keys())
     y_values = list(ptt_dict.values())
 
-    return {
+    return clip_result({
         "x_label": "Time (s)",
         "y_label": "PTT (ms)",
         "x_values": x_values,
         "y_values": y_values,
-    }
+    }, 0.0, start_sec, end_sec)
@@ -1,37 +1,34 @@
-import numpy as np
-from services.pkl_loader import load_pkl, extract_series
-window_sec = 5.0
-def compute_skin_conductance(y_values, fs: float):
-    sig = np.asarray(y_values, dtype=float).flatten()
-    win = max(1, int(round(window_sec * fs)))
+from services.pkl_loader import load_pkl, extract_array
+from services.result_cache import cached_result
+from services.time_range import clip_result
+from services.overall_data.windowing import windowed_series
+WINDOW_SEC = 5.0
+def compute_skin_conductance(y_values, fs: float, window_sec: float = WINDOW_SEC, step_sec: float | None = None):
+    return windowed_series(
+        y_values, fs, "Time (s)", "Skin Conductance", window_sec=window_sec, step_sec=step_sec
+    )
 
-    times, vals = [], []
-    for i in range(0, len(sig) - win + 1, win):
-        window = sig[i : i + win]
-        times.append(i / fs)
-        vals.append(float(np.nanmean(window)))
-
-    return {
-        "x_label": "Time (s)",
-        "y_label": "Skin Conductance",
-        "x_values": times,
-        "y_values": vals,
-    }
-
-def get_skin_conductance(subject: str, sensor: str = "wrist", modality: str = "EDA"):
+@cached_result(version=3)
+def get_skin_conductance(
+    subject: str,
+    sensor: str = "wrist",
+    modality: str = "EDA",
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    window_sec: float = WINDOW_SEC,
+    step_sec: float | None = None,
+):
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    series = extract_series(obj, sensor=sensor, modality=modality, stride=1, limit=None)
+    # Without a sampling rate in the metadata, wrist EDA defaults to 4 Hz and
+    # chest EDA to 700 Hz.
+    fs = float(obj.sampling_rate(sensor, modality, default=4.0 if sensor == "wrist" else 700.0))
 
-    block = obj["signal"][sensor]
-    # dopasowanie case-insensitive
-    key = modality if modality in block else next((k for k in block if k.upper() == modality.upper()), modality)
-    payload = block.get(key)
-    if isinstance(payload, dict):
-        fs = float(payload.get("sampling_rate", 4.0))
-    else:
-        # wrist domyślnie 4 Hz, chest 700 Hz; mamy tylko EDA więc przyjmij 4 jeśli brak meta
-        fs = 4.0 if sensor == "wrist" else 700.0
+    series = extract_array(
+        obj, sensor=sensor, modality=modality, start_sec=start_sec, end_sec=end_sec,
+        pad_sec=window_sec, align_sec=step_sec or window_sec, fs=fs,
+    )
 
-    return compute_skin_conductance(series["y_values"], fs=fs)
\ No newline at end of file
+    result = compute_skin_conductance(series["y_values"], fs=fs, window_sec=window_sec, step_sec=step_sec)
+    return clip_result(result, series["t0"], start_sec, end_sec)
\ No newline at end of file
@@ -1,6 +1,20 @@
 import numpy as np
 from scipy.stats import zscore
-from services.pkl_loader import load_pkl, extract_series
+from services.pkl_loader import load_pkl
+from services.result_cache import cached_result
+from services.resampling import align_signals, grid_times, resample_events
+from services.time_range import clip_result
+from services.overall_data.fiducials import R_PEAKS, peak_range
+from services.overall_data.heart_rate import heart_rate_from_beats
+
+# Common grid for EDA, TEMP and heart rate (the wrist EDA/TEMP rate).
+STRESS_FS = 4.0
+# Length of one output window.
+STRESS_WINDOW_SEC = 5.0
+# Covers the 10 s smoothing kernel plus one 5 s output window.
+STRESS_PAD_SEC = 15.0
+# Beats read beyond the grid so heart rate is interpolated, not held, at its edges.
+HR_PAD_SEC = 5.0
 
 def compute_stress_level(eda, hr, temp, fs: float = 4.0, window_sec: float = 5.0):
     eda = np.asarray(eda).flatten()
@@ -57,31 +71,41 @@ def compute_stress_level(eda, hr, temp, fs: float = 4.0, window_sec: float = 5.0
     }
 
 
-def get_stress_level(subject: str, sensor: str = "wrist"):
+@cached_result(version=1)
+def get_stress_level(
+    subject: str,
+    sensor: str = "wrist",
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+):
+    """
+    EDA and TEMP of `sensor` and beat-to-beat heart rate from the chest ECG
+    R-peaks (fiducial cache) are put on one STRESS_FS grid with
+    services/resampling.
+
+    With a time range, z-scores and smoothing are computed over the requested
+    window (plus STRESS_PAD_SEC on each side) rather than the whole recording.
+    """
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    eda_data = extract_series(obj, sensor=sensor, modality="EDA")
-    temp_data = extract_series(obj, sensor=sensor, modality="TEMP")
-    
-    ecg_data = extract_series(obj, sensor="chest", modality="ECG")
-    
-    eda_series = np.array(eda_data["y_values"])
-    temp_series = np.array(temp_data["y_values"])
-    ecg_series = np.array(ecg_data["y_values"])
-
-    payload = obj["signal"][sensor]["EDA"]
-    if isinstance(payload, dict):
-        fs = payload.get("sampling_rate", 4.0)
-    else:
-        fs = 4.0
+    grid = align_signals(
+        obj, [f"{sensor}.EDA", f"{sensor}.TEMP"], STRESS_FS,
+        start_sec=start_sec, end_sec=end_sec, pad_sec=STRESS_PAD_SEC, align_sec=5.0,
+    )
+    if grid["n"] <= int(STRESS_WINDOW_SEC * STRESS_FS):
+        # The range ends past the recording (or barely reaches into it).
+        return {"x_label": "Time (s)", "y_label": "Stress Level (0-100)", "x_values": [], "y_values": []}
+    t = grid_times(grid["t0"], grid["n"], STRESS_FS)
 
-    downsample_factor = int(700 / 4)
-    ecg_downsampled = ecg_series[::downsample_factor]
-    
-    min_len = min(len(eda_series), len(ecg_downsampled), len(temp_series))
-    eda_series = eda_series[:min_len]
-    ecg_series = ecg_downsampled[:min_len]
-    temp_series = temp_series[:min_len]
+    t0, t1 = grid["t0"] - HR_PAD_SEC, grid["t0"] + grid["n"] / STRESS_FS + HR_PAD_SEC
+    ecg_fs = obj.sampling_rate("chest", "ECG")
+    beats = peak_range(obj, "chest", "ECG", R_PEAKS, int(np.ceil(max(0.0, t0) * ecg_fs)), int(np.ceil(t1 * ecg_fs)))
+    hr = heart_rate_from_beats(beats, 0, ecg_fs, mode="beat")
+    hr_series = resample_events(hr["x_values"], hr["y_values"], t)
 
-    return compute_stress_level(eda_series, ecg_series, temp_series, fs=fs)
+    result = compute_stress_level(
+        grid["values"][f"{sensor}.EDA"], hr_series, grid["values"][f"{sensor}.TEMP"],
+        fs=STRESS_FS, window_sec=STRESS_WINDOW_SEC,
+    )
+    return clip_result(result, grid["t0"], start_sec, end_sec)
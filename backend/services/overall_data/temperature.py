@@ -1,35 +1,32 @@
-import numpy as np
-from services.pkl_loader import load_pkl, extract_series
+from services.pkl_loader import load_pkl, extract_array
+from services.result_cache import cached_result
+from services.time_range import clip_result
+from services.overall_data.windowing import windowed_series
 
-def compute_temperature(y_values, fs: float):
-    window_sec = 5.0
-    sig = np.asarray(y_values, dtype=float).flatten()
-    win = max(1, int(round(window_sec * fs)))
+WINDOW_SEC = 5.0
 
-    times, vals = [], []
-    for i in range(0, len(sig) - win + 1, win):
-        window = sig[i : i + win]
-        times.append((i + win) / fs)
-        vals.append(float(np.nanmean(window)))
+def compute_temperature(y_values, fs: float, window_sec: float = WINDOW_SEC, step_sec: float | None = None):
+    return windowed_series(
+        y_values, fs, "Time (s)", "Temperature (°C)", window_sec=window_sec, step_sec=step_sec
+    )
 
-    return {
-        "x_label" : "Time (s)",
-        "y_label" : "Temperature (°C)",
-        "x_values": times,
-        "y_values": vals
-    }
-
-def get_temperature(subject: str, sensor: str = "wrist", modality: str = "TEMP"):
+@cached_result(version=3)
+def get_temperature(
+    subject: str,
+    sensor: str = "wrist",
+    modality: str = "TEMP",
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    window_sec: float = WINDOW_SEC,
+    step_sec: float | None = None,
+):
     path = f"data/WESAD/{subject}/{subject}.pkl"
     obj = load_pkl(path)
 
-    series = extract_series(obj, sensor=sensor, modality=modality, stride=1, limit=None)
-
-    payload_block = obj["signal"][sensor]
-    key = modality if modality in payload_block else next((k for k in payload_block if k.upper() == modality.upper()), modality)
-    payload = payload_block.get(key)
-    if isinstance(payload, dict):
-        fs = float(payload.get("sampling_rate", 4.0))
-    else:
-        fs = 4.0
-    return compute_temperature(series["y_values"], fs=fs)
\ No newline at end of file
+    fs = float(obj.sampling_rate(sensor, modality, default=4.0))
+    series = extract_array(
+        obj, sensor=sensor, modality=modality, start_sec=start_sec, end_sec=end_sec,
+        pad_sec=window_sec, align_sec=step_sec or window_sec, fs=fs,
+    )
+    result = compute_temperature(series["y_values"], fs=fs, window_sec=window_sec, step_sec=step_sec)
+    return clip_result(result, series["t0"], start_sec, end_sec)
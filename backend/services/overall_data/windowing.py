@@ -0,0 +1,183 @@
+"""
+Vectorised fixed-length window statistics shared by the windowed metrics
+(temperature, skin conductance, movement).
+
+Windows are window_sec long and start every step_sec (default: window_sec, i.e.
+back to back; a smaller step gives overlapping windows). count / mean / std /
+slope come from prefix sums, so their cost is linear in the signal length
+whatever the window / step ratio. The prefix sums restart every CHUNK_SAMPLES
+samples to keep their rounding error small. min / max / median / percentiles
+need the window contents: those are copied out of a strided view
+BLOCK_ELEMENTS values at a time, so memory stays bounded for heavily
+overlapping windows.
+
+Conventions:
+- A window is timestamped at its end, like heart rate.
+- NaN samples are ignored; "count" is the number of valid samples and windows
+  without any are NaN for every other statistic.
+- The trailing samples that do not fill a window are dropped unless
+  partial=True, in which case one last window ends at the final sample.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+STATISTICS = ("mean", "std", "min", "max", "median", "slope", "count")
+# Percentiles are requested as "p<q>", e.g. "p5", "p95".
+MOMENT_STATISTICS = ("mean", "std", "slope", "count")
+
+# Signal samples covered by one run of prefix sums.
+CHUNK_SAMPLES = 1 << 16
+# Window values materialised at once for the order statistics (8 MB of float64).
+BLOCK_ELEMENTS = 1 << 20
+
+
+def window_length(window_sec: float, fs: float) -> int:
+    return max(1, int(round(window_sec * fs)))
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    out = np.zeros(values.size + 1)
+    np.cumsum(values, out=out[1:])
+    return out
+
+
+def _window_moments(sig: np.ndarray, starts: np.ndarray, win: int, fs: float, slope: bool):
+    """count, mean, std and (optionally) least-squares slope per window, NaNs ignored."""
+    count = np.zeros(starts.size)
+    mean = np.full(starts.size, np.nan)
+    std = np.full(starts.size, np.nan)
+    slopes = np.full(starts.size, np.nan) if slope else None
+    step = int(starts[1] - starts[0]) if starts.size > 1 else win
+    per_chunk = max(1, CHUNK_SAMPLES // step)
+    for a in range(0, starts.size, per_chunk):
+        chunk = starts[a : a + per_chunk]
+        seg = sig[chunk[0] : chunk[-1] + win]
+        valid = ~np.isnan(seg)
+        if not valid.any():
+            continue
+        # Values are taken relative to the chunk mean, which keeps the sum of
+        # squares from cancelling for signals far from zero.
+        ref = seg[valid].mean()
+        z = np.where(valid, seg - ref, 0.0)
+        i = chunk - chunk[0]
+        e = i + win
+        c = _prefix(valid)
+        s1 = _prefix(z)
+        s2 = _prefix(z * z)
+        n = c[e] - c[i]
+        ok = n > 0
+        safe = np.where(ok, n, 1.0)
+        m = (s1[e] - s1[i]) / safe
+        rows = slice(a, a + chunk.size)
+        count[rows] = n
+        mean[rows] = np.where(ok, ref + m, np.nan)
+        std[rows] = np.where(ok, np.sqrt(np.maximum((s2[e] - s2[i]) / safe - m * m, 0.0)), np.nan)
+        if slope:
+            # Time in samples from the chunk start; the slope is scaled to per second.
+            t = np.where(valid, np.arange(seg.size, dtype=np.float64), 0.0)
+            st = _prefix(t)
+            stt = _prefix(t * t)
+            sty = _prefix(t * z)
+            sum_t = st[e] - st[i]
+            den = (stt[e] - stt[i]) - sum_t * sum_t / safe
+            num = (sty[e] - sty[i]) - sum_t * (s1[e] - s1[i]) / safe
+            fit = (n >= 2) & (den > 0)
+            slopes[rows] = np.divide(num * fs, den, out=np.full(chunk.size, np.nan), where=fit)
+    return count, mean, std, slopes
+
+
+def _window_order_stats(sig: np.ndarray, starts: np.ndarray, win: int, names) -> Dict[str, np.ndarray]:
+    """min / max / median / percentiles per window, NaNs ignored (all-NaN windows: NaN)."""
+    out = {name: np.full(starts.size, np.nan) for name in names}
+    view = np.lib.stride_tricks.sliding_window_view(sig, win)
+    per_block = max(1, BLOCK_ELEMENTS // win)
+    for a in range(0, starts.size, per_block):
+        block = view[starts[a : a + per_block]]
+        valid = ~np.isnan(block)
+        nonempty = valid.any(axis=1)
+        rows = slice(a, a + block.shape[0])
+        for name in names:
+            if name == "min":
+                value = np.where(valid, block, np.inf).min(axis=1)
+            elif name == "max":
+                value = np.where(valid, block, -np.inf).max(axis=1)
+            else:
+                q = 50.0 if name == "median" else float(name[1:])
+                value = np.full(block.shape[0], np.nan)
+                if nonempty.any():
+                    value[nonempty] = np.nanpercentile(block[nonempty], q, axis=1)
+            out[name][rows] = np.where(nonempty, value, np.nan)
+    return out
+
+
+def window_stats(
+    y_values,
+    fs: float,
+    window_sec: float = 5.0,
+    step_sec: Optional[float] = None,
+    stats: Iterable[str] = ("mean",),
+    partial: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Statistics of y_values per window. Returns {"t_start", "t_end", <stat>: ...}
+    as float64 arrays with one entry per window; "slope" is in units per second.
+    Raises ValueError for an unknown statistic.
+    """
+    sig = np.asarray(y_values, dtype=np.float64).reshape(-1)
+    win = window_length(window_sec, fs)
+    step = window_length(step_sec if step_sec else window_sec, fs)
+    stats = tuple(stats)
+    for name in stats:
+        if name not in STATISTICS and not (name[:1] == "p" and name[1:].replace(".", "", 1).isdigit()):
+            raise ValueError(f"Unknown window statistic: {name}")
+
+    n = sig.size
+    n_full = 0 if n < win else (n - win) // step + 1
+    starts = np.arange(n_full, dtype=np.int64) * step
+    ends = starts + win
+    if partial and n > 0:
+        last = n_full * step
+        if n_full == 0 or (last < n and ends[-1] < n):
+            # The padded tail is NaN, so it is ignored like any other gap.
+            starts = np.append(starts, last)
+            ends = np.append(ends, n)
+            sig = np.concatenate([sig, np.full(last + win - n, np.nan)])
+
+    out: Dict[str, np.ndarray] = {"t_start": starts / fs, "t_end": ends / fs}
+    if starts.size == 0:
+        for name in stats:
+            out[name] = np.empty(0)
+        return out
+
+    count, mean, std, slope = _window_moments(sig, starts, win, fs, slope="slope" in stats)
+    moments = {"count": count, "mean": mean, "std": std, "slope": slope}
+    ordered = _window_order_stats(sig, starts, win, [name for name in stats if name not in MOMENT_STATISTICS])
+    for name in stats:
+        out[name] = moments[name] if name in MOMENT_STATISTICS else ordered[name]
+    return out
+
+
+def windowed_series(
+    y_values,
+    fs: float,
+    x_label: str,
+    y_label: str,
+    window_sec: float = 5.0,
+    step_sec: Optional[float] = None,
+    stat: str = "mean",
+    partial: bool = False,
+) -> Dict[str, Any]:
+    """
+    One statistic per window as a metric result ({x_label, y_label, x_values,
+    y_values}, window-end timestamps, float64 arrays). Windows without valid
+    samples are left out.
+    """
+    res = window_stats(y_values, fs, window_sec, step_sec, stats=(stat,), partial=partial)
+    keep = ~np.isnan(res[stat])
+    return {
+        "x_label": x_label,
+        "y_label": y_label,
+        "x_values": res["t_end"][keep],
+        "y_values": res[stat][keep],
+    }
@@ -0,0 +1,139 @@
+"""
+Metric summaries for many subjects at once (/data/cohort).
+
+Each subject is one job on the shared CPU pool (services/executor; threads
+for subjects without a columnar store, see pool_for): the worker opens the subject once and runs every requested metric on it (result
+cache hits where available), so a cohort costs one recording load per
+subject instead of one per metric. Subjects are reported as soon as their job finishes.
+Cohort aggregates are computed at the end over a subjects x statistics
+matrix per metric, with failed metrics left out as NaN.
+"""
+import time, warnings
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from services.executor import CPU_WORKERS, pool_for, reset_pool
+from services.overall_data_analysis.health_analysis import (
+    METRIC_TIMEOUT_SEC, METRICS, compute_metric, summarize_health
+)
+
+HEALTH = "health_analysis"
+COHORT_METRICS = tuple(METRICS) + (HEALTH,)
+COHORT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def summarize_subject(subject: str, metrics: Sequence[str]) -> Dict[str, Any]:
+    """Summary statistics of the requested metrics for one subject (run in a worker)."""
+    out: Dict[str, Any] = {}
+    physiological = {}
+    for name in METRICS:
+        if name not in metrics and HEALTH not in metrics:
+            continue
+        try:
+            physiological[name] = compute_metric(subject, name)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            physiological[name] = {"error": str(e)}
+        if name in metrics:
+            out[name] = physiological[name]
+    if HEALTH in metrics:
+        try:
+            out[HEALTH] = summarize_health(subject, physiological)
+        except Exception as e:
+            out[HEALTH] = {"error": str(e)}
+    return out
+
+
+def _numeric(summary: Dict[str, Any], name: str) -> Dict[str, float]:
+    """Flat {statistic: value} of one metric summary (health: its vital signs)."""
+    values = summary.get("vital_signs", {}) if name == HEALTH else summary
+    return {k: float(v) for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def cohort_aggregates(results: List[Dict[str, Any]], metrics: Sequence[str]) -> Dict[str, Any]:
+    """
+    mean / std / min / max / percentiles across subjects of every statistic of
+    every metric. Subjects where a metric failed do not count for it.
+    """
+    aggregates: Dict[str, Any] = {}
+    for name in metrics:
+        rows = [_numeric(r["metrics"][name], name) for r in results if name in r.get("metrics", {})]
+        keys = sorted({k for row in rows for k in row})
+        if not keys:
+            aggregates[name] = {}
+            continue
+        matrix = np.array([[row.get(k, np.nan) for k in keys] for row in rows], dtype=np.float64)
+        count = np.sum(~np.isnan(matrix), axis=0)
+        # All-NaN columns (a statistic no subject produced) stay NaN -> null.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            table = {
+                "n": count,
+                "mean": np.nanmean(matrix, axis=0),
+                "std": np.nanstd(matrix, axis=0),
+                "min": np.nanmin(matrix, axis=0),
+                "max": np.nanmax(matrix, axis=0),
+            }
+            pct = np.nanpercentile(matrix, COHORT_PERCENTILES, axis=0)
+        for p, row in zip(COHORT_PERCENTILES, pct):
+            table[f"p{p}"] = row
+        aggregates[name] = {
+            key: {
+                stat: (int(col[i]) if stat == "n" else (None if np.isnan(col[i]) else float(col[i])))
+                for stat, col in table.items()
+            }
+            for i, key in enumerate(keys)
+        }
+    return aggregates
+
+
+def iter_cohort(
+    subjects: Sequence[str], metrics: Sequence[str], timeout: float = METRIC_TIMEOUT_SEC
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {"type": "subject", "subject", "metrics" | "error"} per subject in
+    completion order, then one {"type": "cohort", "subjects", "aggregates"}.
+    timeout is the budget per subject job, counted from submission; late
+    subjects are reported with an error.
+    """
+    futures, pools = {}, {}
+    for subject in subjects:
+        pool = pool_for(subject)
+        future = pool.submit(summarize_subject, subject, tuple(metrics))
+        futures[future], pools[future] = subject, pool
+    # Jobs queue behind each other, so the deadline grows with the pool's backlog.
+    rounds = -(-len(futures) // CPU_WORKERS)
+    deadline = time.monotonic() + timeout * max(1, rounds)
+    results = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                future.cancel()
+                results.append({"type": "subject", "subject": futures[future], "error": "timed out"})
+                yield results[-1]
+            break
+        for future in done:
+            subject = futures[future]
+            try:
+                line = {"type": "subject", "subject": subject, "metrics": future.result()}
+            except FileNotFoundError:
+                line = {"type": "subject", "subject": subject, "error": "Subject data not found"}
+            except BrokenProcessPool as e:
+                reset_pool(pools[future])
+                line = {"type": "subject", "subject": subject, "error": f"worker crashed: {e}"}
+            except Exception as e:
+                line = {"type": "subject", "subject": subject, "error": f"{type(e).__name__}: {e}"}
+            results.append(line)
+            yield line
+    yield {
+        "type": "cohort",
+        "subjects": sum("metrics" in r for r in results),
+        "metrics": list(metrics),
+        "aggregates": cohort_aggregates(results, metrics),
+    }
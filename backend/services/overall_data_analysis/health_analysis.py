@@ -1,5 +1,12 @@
+import os, time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
-from typing import Dict, Any, Optional
+from typing import Dict, Any
+from services.executor import cpu_pool, in_worker, reset_pool
+from services.pkl_loader import load_pkl
+from services.result_cache import cached_result
+from services.signal_store import has_fresh_store
 from services.overall_data.heart_rate import get_heart_rate
 from services.overall_data.breathing_rate import get_breathing_rate
 from services.overall_data.stress_level import get_stress_level
@@ -12,6 +19,85 @@ from services.questionnaire_parser import (
     calculate_questionnaire_scores
 )
 
+# Metric name -> (service, keyword arguments, summary statistics).
+METRICS = {
+    "heart_rate": (get_heart_rate, {"sensor": "chest", "modality": "ECG"}, ("mean", "std", "min", "max")),
+    "breathing_rate": (get_breathing_rate, {"winsec": 5, "step_sec": 5}, ("mean", "std")),
+    "stress_level": (get_stress_level, {"sensor": "wrist"}, ("mean", "std", "max")),
+    "temperature": (get_temperature, {"sensor": "wrist", "modality": "TEMP"}, ("mean", "std")),
+    "pulse_transit_time": (get_pulse_transit_time, {"winsec": 5, "step_sec": 5}, ("mean", "std")),
+    "skin_conductance": (get_skin_conductance, {"sensor": "wrist", "modality": "EDA"}, ("mean", "std")),
+}
+# Files besides the recording that the analysis reads (result cache key).
+HEALTH_SOURCE_FILES = ("{subject}_quest.csv", "{subject}_readme.txt")
+STATS = {"mean": np.mean, "std": np.std, "min": np.min, "max": np.max}
+# Per-metric budget, counted from the start of the analysis.
+METRIC_TIMEOUT_SEC = float(os.environ.get("HEALTH_METRIC_TIMEOUT_SEC", "60"))
+
+
+def compute_metric(subject: str, name: str) -> Dict[str, float]:
+    """Run one metric service and reduce its series to the summary statistics."""
+    compute, kwargs, stats = METRICS[name]
+    values = compute(subject, **kwargs)["y_values"]
+    return {stat: float(STATS[stat](values)) if len(values) else 0 for stat in stats}
+
+
+def collect_physiological_metrics(subject: str, timeout: float = METRIC_TIMEOUT_SEC) -> Dict[str, Any]:
+    """
+    Run every entry of METRICS concurrently. A metric that raises or misses the
+    deadline is reported as {"error": ...} without affecting the others.
+
+    Subjects with a columnar store run on the shared CPU pool (see
+    services/executor): workers receive only the subject id and metric name
+    and memory-map the same store files, so the arrays are shared through the
+    page cache instead of being pickled to each worker. Pickle-only subjects,
+    and calls made from inside a pool worker (executor.in_worker), run on
+    threads in this process instead, so the pickle is unpickled once rather
+    than once per worker.
+    """
+    # Raises FileNotFoundError for an unknown subject before anything is queued.
+    obj = load_pkl(f"data/WESAD/{subject}/{subject}.pkl")
+    executor: Executor
+    if has_fresh_store(obj.path) and not in_worker():
+        executor = cpu_pool()
+        own_executor = False
+    else:
+        executor = ThreadPoolExecutor(max_workers=len(METRICS), thread_name_prefix="health")
+        own_executor = True
+
+    try:
+        futures = {name: executor.submit(compute_metric, subject, name) for name in METRICS}
+    except BrokenProcessPool:
+        reset_pool(executor)
+        raise
+    deadline = time.monotonic() + timeout
+    metrics = {}
+    try:
+        for name, future in futures.items():
+            try:
+                metrics[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                future.cancel()
+                metrics[name] = {"error": f"timed out after {timeout:g} s"}
+            except BrokenProcessPool as e:
+                reset_pool(executor)
+                metrics[name] = {"error": f"worker crashed: {e}"}
+            except Exception as e:
+                metrics[name] = {"error": str(e)}
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return metrics
+
+
+def complete(analysis: Dict[str, Any]) -> bool:
+    """True when every physiological metric of an analysis was computed."""
+    return not analysis.get("failed_metrics")
+
+
+# Partial analyses (a metric failed or timed out) are not cached, so the next
+# request retries the missing metrics.
+@cached_result(version=1, extra_files=HEALTH_SOURCE_FILES, cacheable=complete)
 def get_comprehensive_health_analysis(subject: str) -> Dict[str, Any]:
     """
     Returns:
@@ -22,67 +108,18 @@ def get_comprehensive_health_analysis(subject: str) -> Dict[str, Any]:
         - health_scores: calculated health scores
         - overall_state: overall state (0-100)
         - ai_ready_summary: data ready for AI analysis
+        - failed_metrics: {metric: error}, only when a metric failed
+
+    The six metric pipelines run concurrently (collect_physiological_metrics),
+    so latency is close to the slowest metric rather than their sum.
     """
     
-    physiological_metrics = {}
-    
-    try:
-        hr_data = get_heart_rate(subject, sensor="chest", modality="ECG")
-        physiological_metrics["heart_rate"] = {
-            "mean": float(np.mean(hr_data["y_values"])) if hr_data["y_values"] else 0,
-            "std": float(np.std(hr_data["y_values"])) if hr_data["y_values"] else 0,
-            "min": float(np.min(hr_data["y_values"])) if hr_data["y_values"] else 0,
-            "max": float(np.max(hr_data["y_values"])) if hr_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["heart_rate"] = {"error": str(e)}
-    
-    try:
-        br_data = get_breathing_rate(subject, winsec=5, step_sec=5)
-        physiological_metrics["breathing_rate"] = {
-            "mean": float(np.mean(br_data["y_values"])) if br_data["y_values"] else 0,
-            "std": float(np.std(br_data["y_values"])) if br_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["breathing_rate"] = {"error": str(e)}
-    
-    try:
-        stress_data = get_stress_level(subject, sensor="wrist")
-        physiological_metrics["stress_level"] = {
-            "mean": float(np.mean(stress_data["y_values"])) if stress_data["y_values"] else 0,
-            "std": float(np.std(stress_data["y_values"])) if stress_data["y_values"] else 0,
-            "max": float(np.max(stress_data["y_values"])) if stress_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["stress_level"] = {"error": str(e)}
-    
-    try:
-        temp_data = get_temperature(subject, sensor="wrist", modality="TEMP")
-        physiological_metrics["temperature"] = {
-            "mean": float(np.mean(temp_data["y_values"])) if temp_data["y_values"] else 0,
-            "std": float(np.std(temp_data["y_values"])) if temp_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["temperature"] = {"error": str(e)}
-    
-    try:
-        ptt_data = get_pulse_transit_time(subject, winsec=5, step_sec=5)
-        physiological_metrics["pulse_transit_time"] = {
-            "mean": float(np.mean(ptt_data["y_values"])) if ptt_data["y_values"] else 0,
-            "std": float(np.std(ptt_data["y_values"])) if ptt_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["pulse_transit_time"] = {"error": str(e)}
-    
-    try:
-        sc_data = get_skin_conductance(subject, sensor="wrist", modality="EDA")
-        physiological_metrics["skin_conductance"] = {
-            "mean": float(np.mean(sc_data["y_values"])) if sc_data["y_values"] else 0,
-            "std": float(np.std(sc_data["y_values"])) if sc_data["y_values"] else 0
-        }
-    except Exception as e:
-        physiological_metrics["skin_conductance"] = {"error": str(e)}
-    
+    physiological_metrics = collect_physiological_metrics(subject)
+    return summarize_health(subject, physiological_metrics)
+
+
+def summarize_health(subject: str, physiological_metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """Scores and AI-ready summary from already computed physiological metrics."""
     questionnaire_data = parse_questionnaire(subject)
     questionnaire_scores = calculate_questionnaire_scores(questionnaire_data)
     personal_data = parse_readme(subject)
@@ -102,6 +139,13 @@ def get_comprehensive_health_analysis(subject: str) -> Dict[str, Any]:
         health_scores,
         overall_state
     )
+
+    failed = {
+        name: value["error"] for name, value in physiological_metrics.items()
+        if isinstance(value, dict) and "error" in value
+    }
+    if failed:
+        ai_ready_summary["failed_metrics"] = failed
     
     return ai_ready_summary
 
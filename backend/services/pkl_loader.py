@@ -1,7 +1,10 @@
-import math, pickle, os
-from typing import Any, Dict, List, Optional
+import pickle, os
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
 import numpy as np
-from functools import lru_cache
+from services.signal_store import MANIFEST_NAME, columnar_dir, has_fresh_store, open_array, read_manifest
+from services.subject_cache import SubjectCache, file_fingerprint
+from services.time_range import sample_range
 
 LABEL_FS = 700
 LABEL_MAP = {
@@ -24,12 +27,214 @@ DEFAULT_FS = {
     "EMG": 700,
 }
 WRIST_ACC_DIVISOR = 64
-@lru_cache(maxsize=16)
-def load_pkl(path: str) -> Dict[str, Any]:
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-    with open(path, "rb") as f:
-        return pickle.load(f, encoding="latin1")
+# Samples per chunk when streaming a series (see iter_array_chunks).
+STREAM_CHUNK_ROWS = 65536
+SUBJECT_CACHE = SubjectCache()
+
+
+class SubjectData(Mapping):
+    """
+    Lazy handle on one subject.
+
+    Metadata (sensors, modalities, shapes, sampling rates) is known up front;
+    modality arrays are opened on first access and cached as separate entries in
+    SUBJECT_CACHE, so reading wrist TEMP never pulls the 700 Hz chest block into
+    memory and a cold modality can be evicted on its own. With a columnar store
+    arrays are memory-mapped; with the pickle fallback the file has to be
+    unpickled once, after which it is split into the same per-modality entries.
+
+    The handle still indexes like the raw WESAD dict
+    (obj["signal"][sensor][modality], obj["label"], obj.get("subject")).
+    """
+
+    def __init__(self, path: str, fingerprint, meta: Dict[str, Any], store_dir: Optional[str] = None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.store_dir = store_dir
+        self._meta = meta
+
+    @classmethod
+    def open(cls, path: str, fingerprint) -> "SubjectData":
+        # Prefer the memory-mapped columnar store (see services/signal_store.py);
+        # the pickle itself is only unpickled when no up-to-date store exists.
+        if has_fresh_store(path):
+            store_dir = columnar_dir(path)
+            manifest = read_manifest(store_dir)
+            if manifest is not None:
+                return cls(path, fingerprint, manifest, store_dir=store_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        handle = cls(path, fingerprint, {})
+        handle._meta = handle._load_pickle()
+        return handle
+
+    @property
+    def subject(self) -> Optional[str]:
+        return self._meta.get("subject")
+
+    def sensors(self) -> List[str]:
+        return list(self._meta.get("signals", {}).keys())
+
+    def modalities(self, sensor: str) -> List[str]:
+        return list(self._meta.get("signals", {}).get(sensor, {}).keys())
+
+    def resolve(self, sensor: str, modality: str) -> str:
+        """Actual modality key for a case-insensitive name (Resp vs RESP)."""
+        block = self._meta.get("signals", {}).get(sensor)
+        if block is None:
+            raise KeyError(sensor)
+        if modality in block:
+            return modality
+        for key in block:
+            if key.upper() == modality.upper():
+                return key
+        raise KeyError(modality)
+
+    def meta(self, sensor: str, modality: str) -> Dict[str, Any]:
+        key = self.resolve(sensor, modality)
+        entry = self._meta["signals"][sensor][key]
+        return {
+            "sampling_rate": entry.get("sampling_rate"),
+            "shape": tuple(entry["shape"]) if entry.get("shape") is not None else None,
+            "dtype": entry.get("dtype"),
+        }
+
+    def sampling_rate(self, sensor: str, modality: str, default: Optional[float] = None):
+        """Rate stored with the signal, else `default`, else DEFAULT_FS."""
+        fs = self.meta(sensor, modality)["sampling_rate"]
+        if fs:
+            return fs
+        if default is not None:
+            return default
+        return DEFAULT_FS.get(modality.upper())
+
+    def signal(self, sensor: str, modality: str) -> np.ndarray:
+        key = self.resolve(sensor, modality)
+        return self._array(("signal", sensor, key), self._meta["signals"][sensor][key])
+
+    def label(self) -> np.ndarray:
+        if self._meta.get("label") is None:
+            raise KeyError("label")
+        return self._array(("label",), self._meta["label"])
+
+    def _array(self, part, entry: Dict[str, Any]) -> np.ndarray:
+        if self.store_dir is not None:
+            loader = lambda: open_array(self.store_dir, entry)
+        else:
+            loader = lambda: self._load_pickle(want=part)
+        return SUBJECT_CACHE.get_or_load((self.path,) + part, self.fingerprint, loader)
+
+    def _load_pickle(self, want=None):
+        """
+        Unpickle the subject and cache every modality as its own entry.
+        Returns the metadata dict, or the array for `want` if given.
+        """
+        with open(self.path, "rb") as f:
+            obj = pickle.load(f, encoding="latin1")
+
+        meta: Dict[str, Any] = {"subject": obj.get("subject"), "signals": {}, "label": None}
+        found = None
+        for sensor, block in (obj.get("signal") or {}).items():
+            meta["signals"][sensor] = {}
+            for modality, payload in block.items():
+                if isinstance(payload, dict) and "signal" in payload:
+                    raw = payload["signal"]
+                    fs = payload.get("sampling_rate")
+                else:
+                    raw = payload
+                    fs = None
+                arr = np.asarray(raw)
+                meta["signals"][sensor][modality] = {
+                    "sampling_rate": fs,
+                    "shape": list(arr.shape),
+                    "dtype": arr.dtype.str,
+                }
+                part = ("signal", sensor, modality)
+                if part != want:
+                    SUBJECT_CACHE.put((self.path,) + part, self.fingerprint, arr)
+                else:
+                    found = arr
+        if obj.get("label") is not None:
+            label = np.asarray(obj["label"])
+            meta["label"] = {"sampling_rate": LABEL_FS, "shape": list(label.shape), "dtype": label.dtype.str}
+            if want != ("label",):
+                SUBJECT_CACHE.put((self.path, "label"), self.fingerprint, label)
+            else:
+                found = label
+        if want is None:
+            return meta
+        if found is None:
+            raise KeyError(want[-1])
+        return found
+
+    # Mapping interface, mirroring the raw WESAD pickle layout.
+    def __getitem__(self, key: str) -> Any:
+        if key == "subject":
+            return self.subject
+        if key == "signal":
+            return _SignalView(self)
+        if key == "label":
+            return self.label()
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        keys = ["subject", "signal"]
+        if self._meta.get("label") is not None:
+            keys.append("label")
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+
+class _SignalView(Mapping):
+    def __init__(self, handle: SubjectData):
+        self._handle = handle
+
+    def __getitem__(self, sensor: str) -> "_SensorView":
+        if sensor not in self._handle.sensors():
+            raise KeyError(sensor)
+        return _SensorView(self._handle, sensor)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._handle.sensors())
+
+    def __len__(self) -> int:
+        return len(self._handle.sensors())
+
+
+class _SensorView(Mapping):
+    def __init__(self, handle: SubjectData, sensor: str):
+        self._handle = handle
+        self._sensor = sensor
+
+    def __getitem__(self, modality: str) -> Any:
+        if modality not in self._handle.modalities(self._sensor):
+            raise KeyError(modality)
+        arr = self._handle.signal(self._sensor, modality)
+        fs = self._handle.meta(self._sensor, modality)["sampling_rate"]
+        if fs is None:
+            return arr
+        return {"signal": arr, "sampling_rate": fs}
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._handle.modalities(self._sensor))
+
+    def __len__(self) -> int:
+        return len(self._handle.modalities(self._sensor))
+
+
+def subject_fingerprint(path: str):
+    """(size, mtime) of the pickle and of its columnar manifest, if present."""
+    return file_fingerprint(path, os.path.join(columnar_dir(path), MANIFEST_NAME))
+
+
+def load_pkl(path: str) -> SubjectData:
+    # Raises FileNotFoundError when neither the pickle nor a store exists.
+    fingerprint = subject_fingerprint(path)
+    return SUBJECT_CACHE.get_or_load(
+        (path,), fingerprint, lambda: SubjectData.open(path, fingerprint)
+    )
 
 def _units(modality: str) -> str:
     return {
@@ -43,129 +248,183 @@ def _units(modality: str) -> str:
         "LABEL": "ID",
     }.get(modality.upper(), "a.u.")
 
-def list_signals(obj: Dict[str, Any]) -> Dict[str, Any]:
-    out: Dict[str, Any] = {"subject": obj.get("subject"), "sensors": {}}
-    sig = obj.get("signal", {})
+def list_signals(obj: SubjectData) -> Dict[str, Any]:
+    # Answered from metadata alone; no signal data is read.
+    out: Dict[str, Any] = {"subject": obj.subject, "sensors": {}}
     for sensor in ("wrist", "chest"):
-        sensor_block = sig.get(sensor)
-        if not sensor_block:
+        modalities = obj.modalities(sensor)
+        if not modalities:
             continue
         out["sensors"][sensor] = {}
-        for modality, payload in sensor_block.items():
-            # Two possible shapes:
-            # 1) dict with keys: sampling_rate, signal
-            # 2) raw ndarray/list (no metadata)
-            if isinstance(payload, dict) and "signal" in payload:
-                data = payload.get("signal")
-                fs = payload.get("sampling_rate")
-            else:
-                data = payload
-                fs = None
-            shape = None
-            try:
-
-                if hasattr(data, "shape"):
-                    shape = tuple(int(x) for x in data.shape)
-                else:
-                    shape = (len(data),)
-            except Exception:
-                try:
-                    shape = (len(data),)
-                except Exception:
-                    shape = None
+        for modality in modalities:
+            meta = obj.meta(sensor, modality)
+            fs = meta["sampling_rate"]
             if fs is None:
                 fs = DEFAULT_FS.get(modality.upper())
-            out["sensors"][sensor][modality] = {"sampling_rate": fs, "shape": shape}
+            out["sensors"][sensor][modality] = {"sampling_rate": fs, "shape": meta["shape"]}
     out["label"] = {"sampling_rate": LABEL_FS, "desc": LABEL_MAP}
     return out
 
-def extract_series(
-    obj: Dict[str, Any],
+def select_rows(
+    obj: SubjectData,
     sensor: str,
     modality: str,
     axis: Optional[str] = None,
     stride: int = 1,
     limit: Optional[int] = None,
-) -> Dict[str, Any]:
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    pad_sec: float = 0.0,
+    align_sec: Optional[float] = None,
+    fs: Optional[float] = None,
+):
+    """
+    Selected rows of the stored array (a view; nothing is read yet) plus the
+    series metadata shared by extract_array and iter_array_chunks.
+    """
     sensor = sensor.lower()
     modality_u = modality.upper()
 
     # Labels special case
     if sensor == "label" or modality_u == "LABEL":
-        y_vals = _ensure_list(obj["label"])
-        fs = LABEL_FS
+        raw = obj.label()
+        fs = fs or LABEL_FS
+    else:
+        raw = obj.signal(sensor, modality)
+        fs = fs or obj.sampling_rate(sensor, modality) or 1
+
+    i0, i1 = sample_range(len(raw), fs, start_sec, end_sec, pad_sec=pad_sec, align_sec=align_sec)
+    stride = max(1, int(stride))
+    rows = raw[i0:i1:stride]
+    if limit is not None and limit > 0:
+        rows = rows[:limit]
+
+    if sensor == "label" or modality_u == "LABEL":
         title = f"Labels @ {fs} Hz"
         y_label = "Condition ID"
     else:
-        payload = obj["signal"][sensor][modality]
-        if isinstance(payload, dict) and "signal" in payload:
-            raw = payload["signal"]
-            fs = payload.get("sampling_rate") or DEFAULT_FS.get(modality_u, 1)
-        else:
-            raw = payload
-            fs = DEFAULT_FS.get(modality_u, 1)
-
-        # Convert data
-        try:
-            arr = np.asarray(raw, dtype=float)
-            if modality_u == "ACC" and arr.ndim == 2 and arr.shape[1] >= 3:
-                if axis and axis.lower() in ("x","y","z"):
-                    idx = {"x":0,"y":1,"z":2}[axis.lower()]
-                    arr_use = arr[:, idx]
-                else:
-                    arr_use = np.sqrt((arr[:,0]**2)+(arr[:,1]**2)+(arr[:,2]**2))
-                if sensor == "wrist":
-                    arr_use = arr_use / WRIST_ACC_DIVISOR
-                y_vals = arr_use.tolist()
-                axis_suffix = f" ({axis.lower() if axis else 'mag'})"
-            else:
-                if modality_u == "ACC" and sensor == "wrist":
-                    arr = arr / WRIST_ACC_DIVISOR
-                y_vals = arr.tolist()
-                axis_suffix = ""
-        except Exception:
-            if modality_u == "ACC" and isinstance(raw, list) and raw and isinstance(raw[0], (list, tuple)):
-                if axis and axis.lower() in ("x","y","z"):
-                    pos = {"x":0,"y":1,"z":2}[axis.lower()]
-                    y_vals = [float(v[pos]) for v in raw]
-                    if sensor == "wrist":
-                        y_vals = [val / WRIST_ACC_DIVISOR for val in y_vals]
-                    axis_suffix = f" ({axis.lower()})"
-                else:
-                    vals = [math.sqrt(v[0]**2+v[1]**2+v[2]**2) for v in raw]
-                    if sensor == "wrist":
-                        vals = [val / WRIST_ACC_DIVISOR for val in vals]
-                    y_vals = vals
-                    axis_suffix = " (mag)"
-            else:
-                y_vals = [float(v) for v in raw]
-                if modality_u == "ACC" and sensor == "wrist":
-                    y_vals = [val / WRIST_ACC_DIVISOR for val in y_vals]
-                axis_suffix = ""
+        axis_suffix = ""
+        if modality_u == "ACC" and rows.ndim == 2 and rows.shape[1] >= 3:
+            axis_suffix = f" ({axis.lower() if axis else 'mag'})"
         unit = _units(modality_u)
         y_label = f"{modality_u}{axis_suffix} [{unit}]"
         title = f"{sensor.capitalize()} {modality_u}{axis_suffix} @ {fs} Hz"
 
-    # Downsample / limit
-    if stride > 1:
-        y_vals = y_vals[::stride]
-    if limit is not None and limit > 0:
-        y_vals = y_vals[:limit]
-
-    x_vals = [i / fs for i in range(len(y_vals))]
-    return {
+    meta = {
         "chart_title": title,
         "x_label": "Time (s)",
         "y_label": y_label,
-        "x_values": x_vals,
-        "y_values": y_vals,
+        "fs": fs,
+        "t0": i0 / fs,
+        "dt": stride / fs,
     }
+    return rows, meta
+
 
-def _ensure_list(x) -> List[float]:
-    try:
-        import numpy as np
-        if isinstance(x, np.ndarray):
-            return x.astype(float).tolist()
-    except Exception:
-        pass
-    return [float(v) for v in x]
\ No newline at end of file
+def row_values(rows, sensor: str, modality: str, axis: Optional[str]) -> np.ndarray:
+    """float64 plotting values for selected rows (ACC axis/magnitude, wrist ACC scaling)."""
+    sensor = sensor.lower()
+    modality_u = modality.upper()
+    arr = np.asarray(rows, dtype=np.float64)
+    if sensor == "label" or modality_u == "LABEL":
+        return arr.reshape(-1)
+    if modality_u == "ACC" and arr.ndim == 2 and arr.shape[1] >= 3:
+        if axis and axis.lower() in ("x", "y", "z"):
+            y = arr[:, {"x": 0, "y": 1, "z": 2}[axis.lower()]]
+        else:
+            y = np.sqrt(np.einsum("ij,ij->i", arr[:, :3], arr[:, :3]))
+    elif arr.ndim == 2 and arr.shape[1] == 1:
+        y = arr[:, 0]
+    else:
+        y = arr
+    if modality_u == "ACC" and sensor == "wrist":
+        y = y / WRIST_ACC_DIVISOR
+    return y
+
+
+def extract_array(
+    obj: SubjectData,
+    sensor: str,
+    modality: str,
+    axis: Optional[str] = None,
+    stride: int = 1,
+    limit: Optional[int] = None,
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    pad_sec: float = 0.0,
+    align_sec: Optional[float] = None,
+    fs: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Same selection as extract_series, but returns the samples as a float64
+    ndarray instead of Python lists. The time range (see
+    services/time_range.sample_range), stride and limit are applied to the
+    stored array first, so only the selected rows are read and converted; the
+    time axis is implied by t0 + i * dt (see time_axis). `fs` overrides the
+    stored sampling rate for callers that use their own default.
+    """
+    rows, series = select_rows(
+        obj, sensor, modality, axis, stride, limit, start_sec, end_sec, pad_sec, align_sec, fs
+    )
+    series["y_values"] = row_values(rows, sensor, modality, axis)
+    return series
+
+
+def iter_array_chunks(
+    obj: SubjectData,
+    sensor: str,
+    modality: str,
+    axis: Optional[str] = None,
+    stride: int = 1,
+    limit: Optional[int] = None,
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    chunk_rows: int = STREAM_CHUNK_ROWS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    extract_array split into consecutive pieces of at most chunk_rows samples,
+    each with its own t0. Rows are converted one chunk at a time, so exporting a
+    full-resolution recording never holds more than one chunk of float64 values.
+    An empty selection yields a single empty chunk (the labels still describe
+    the series).
+    """
+    rows, meta = select_rows(
+        obj, sensor, modality, axis, stride, limit, start_sec, end_sec, 0.0, None, None
+    )
+    n = len(rows)
+    for a in range(0, max(n, 1), chunk_rows):
+        chunk = dict(meta)
+        chunk["t0"] = meta["t0"] + a * meta["dt"]
+        chunk["y_values"] = row_values(rows[a : a + chunk_rows], sensor, modality, axis)
+        yield chunk
+
+
+def time_axis(series: Dict[str, Any]) -> np.ndarray:
+    """Timestamps (s) of the samples in an extract_array result."""
+    return series["t0"] + np.arange(len(series["y_values"])) * series["dt"]
+
+
+def extract_series(
+    obj: SubjectData,
+    sensor: str,
+    modality: str,
+    axis: Optional[str] = None,
+    stride: int = 1,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    series = extract_array(obj, sensor, modality, axis=axis, stride=stride, limit=limit)
+    return series_to_json(series)
+
+
+def series_to_json(series: Dict[str, Any], as_array: bool = False) -> Dict[str, Any]:
+    """
+    JSON shape of a series: extract_array results get their time axis
+    materialised, ndarray values become lists (kept as ndarrays with as_array,
+    for services/json_response), internal timing keys are dropped.
+    """
+    out = {k: v for k, v in series.items() if k not in ("fs", "t0", "dt", "x_values", "y_values")}
+    x = time_axis(series) if "dt" in series else series["x_values"]
+    y = series["y_values"]
+    out["x_values"] = x.tolist() if isinstance(x, np.ndarray) and not as_array else x
+    out["y_values"] = y.tolist() if isinstance(y, np.ndarray) and not as_array else y
+    return out
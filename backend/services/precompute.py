@@ -0,0 +1,152 @@
+"""
+Batch precompute of every derived metric, so the first request after a deploy
+is a result cache hit (see services/result_cache.py).
+
+For each subject under data/WESAD the metric services are run with the
+parameters the /data endpoints use by default, one process-pool job per
+subject (so the recording is opened and its fiducial points detected once),
+followed by the health analysis summary. Results land in the shared result
+cache; fiducial points (services/overall_data/fiducials.py) are persisted
+along the way. A subject is recorded as done only when every metric and the
+health analysis (including the metrics inside it) succeeded.
+
+Runs are incremental: PRECOMPUTE_MANIFEST records, per subject, the
+fingerprint of its source files and the algorithm version of every metric,
+and subjects whose entry still matches are skipped (--force recomputes).
+
+Run from the backend folder (after converting, see services/signal_store.py):
+    python -m services.precompute                # every subject
+    python -m services.precompute S2 S3 -j 4     # selected subjects, 4 processes
+"""
+import argparse, json, os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from services.result_cache import RESULT_CACHE, subject_files
+from services.signal_store import discover_subjects
+from services.subject_cache import file_fingerprint
+from services.overall_data.movement import get_movement
+from services.overall_data_analysis.health_analysis import (
+    HEALTH_SOURCE_FILES, METRICS, complete, get_comprehensive_health_analysis
+)
+
+PRECOMPUTE_MANIFEST = os.path.join(RESULT_CACHE.directory, "precompute.json")
+
+# Metric name -> (service, keyword arguments); the endpoint defaults.
+JOBS = {name: (compute, kwargs) for name, (compute, kwargs, _) in METRICS.items()}
+JOBS["movement"] = (get_movement, {"sensor": "wrist", "modality": "ACC"})
+
+
+def versions() -> Dict[str, int]:
+    out = {name: compute.cache_version for name, (compute, _) in JOBS.items()}
+    out["health_analysis"] = get_comprehensive_health_analysis.cache_version
+    return out
+
+
+def source_fingerprint(subject: str) -> Any:
+    """JSON form of the fingerprint of every file the subject's results read."""
+    return json.loads(json.dumps(file_fingerprint(*subject_files(subject, HEALTH_SOURCE_FILES))))
+
+
+def read_manifest(path: str = PRECOMPUTE_MANIFEST) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest: Dict[str, Any], path: str = PRECOMPUTE_MANIFEST) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def run_subject(subject: str) -> Dict[str, Any]:
+    """
+    Compute every metric of one subject (filling the result cache) in this
+    process. Returns {metric: seconds taken or error string}.
+    """
+    report: Dict[str, Any] = {}
+    for name, (compute, kwargs) in JOBS.items():
+        t0 = time.perf_counter()
+        try:
+            compute(subject, **kwargs)
+            report[name] = time.perf_counter() - t0
+        except Exception as e:
+            report[name] = f"{type(e).__name__}: {e}"
+    return report
+
+
+def precompute(subjects: List[str], workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Fill the result cache for subjects. Returns {subject: {metric: seconds or
+    error string}} for the subjects that were computed.
+    """
+    manifest = read_manifest()
+    current = versions()
+    todo = {}
+    for subject in subjects:
+        try:
+            source = source_fingerprint(subject)
+        except FileNotFoundError:
+            print(f"{subject}: missing data/WESAD/{subject}/{subject}.pkl")
+            continue
+        entry = manifest.get(subject, {})
+        if not force and entry.get("source") == source and entry.get("versions") == current:
+            print(f"{subject}: up to date")
+            continue
+        todo[subject] = source
+
+    report: Dict[str, Dict[str, Any]] = {subject: {} for subject in todo}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_subject, subject): subject for subject in todo}
+        for future in as_completed(futures):
+            subject = futures[future]
+            try:
+                report[subject] = future.result()
+            except Exception as e:
+                report[subject] = {name: f"{type(e).__name__}: {e}" for name in JOBS}
+            for name, value in report[subject].items():
+                print(f"{subject} {name}: " + (f"failed ({value})" if isinstance(value, str) else f"{value:.2f}s"))
+
+    # Every metric is cached by now, so this only assembles the summary.
+    for subject, source in todo.items():
+        t0 = time.perf_counter()
+        try:
+            analysis = get_comprehensive_health_analysis(subject)
+            if complete(analysis):
+                report[subject]["health_analysis"] = time.perf_counter() - t0
+            else:
+                failed = analysis["failed_metrics"]
+                report[subject]["health_analysis"] = "incomplete: " + ", ".join(
+                    f"{name} ({error})" for name, error in sorted(failed.items())
+                )
+        except Exception as e:
+            report[subject]["health_analysis"] = f"{type(e).__name__}: {e}"
+        failed = [name for name, value in report[subject].items() if isinstance(value, str)]
+        total = sum(value for value in report[subject].values() if not isinstance(value, str))
+        print(f"{subject}: {len(report[subject]) - len(failed)} results in {total:.1f}s of compute"
+              + (f", failed: {', '.join(sorted(failed))}" if failed else ""))
+        if not failed:
+            manifest[subject] = {"source": source, "versions": current}
+            write_manifest(manifest)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Precompute derived metrics into the result cache.")
+    parser.add_argument("subjects", nargs="*", help="Subject IDs, e.g. S2 S3 (default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Recompute up-to-date subjects")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    report = precompute(args.subjects or discover_subjects(), workers=args.workers, force=args.force)
+    print(f"{len(report)} subject(s) precomputed in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
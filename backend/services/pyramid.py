@@ -0,0 +1,271 @@
+"""
+Multi-resolution min/max/mean pyramids for zooming over raw signals.
+
+Level k summarises buckets of 2**k consecutive samples of the series that
+extract_array returns (so ACC is already reduced to an axis or magnitude and
+wrist ACC is scaled by WRIST_ACC_DIVISOR). Every level is built from the one
+below it, and all levels of one statistic are stored back to back in a single
+.npy file next to the subject data (float32 values, int32 sample positions of
+each bucket's min and max, so envelopes keep their time order):
+
+    data/WESAD/S2/S2_pyramid/pyramid.json             level offsets, labels, source fingerprint
+    data/WESAD/S2/S2_pyramid/chest_ECG.{min,max,mean,argmin,argmax}.npy
+    data/WESAD/S2/S2_pyramid/wrist_ACC_mag.{min,max,mean,argmin,argmax}.npy
+
+A /data/series query with target_points then reads only the buckets of the
+coarsest level that still has enough points in the requested range, which is
+O(target_points) regardless of how many raw samples the range spans.
+
+Build pyramids (run from the backend folder, after any signal_store conversion):
+    python -m services.pyramid            # every subject under data/WESAD
+    python -m services.pyramid S2 S3
+"""
+import argparse, json, os, time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.downsampling import downsample
+from services.pkl_loader import SUBJECT_CACHE, extract_array, load_pkl, subject_fingerprint
+from services.signal_store import DATA_ROOT, discover_subjects
+from services.subject_cache import file_fingerprint
+from services.time_range import sample_range
+
+PYRAMID_VERSION = 2
+PYRAMID_SUFFIX = "_pyramid"
+PYRAMID_MANIFEST = "pyramid.json"
+# Stop adding levels once a level has at most this many buckets.
+MIN_LEVEL_BUCKETS = 64
+STATS = ("min", "max", "mean", "argmin", "argmax")
+ACC_VARIANTS = ("mag", "x", "y", "z")
+
+
+def pyramid_dir(pkl_path: str) -> str:
+    return os.path.splitext(pkl_path)[0] + PYRAMID_SUFFIX
+
+
+def _entry_name(sensor: str, modality: str, axis: Optional[str]) -> str:
+    if modality.upper() == "ACC":
+        return f"{sensor}_{modality}_{(axis or 'mag').lower()}"
+    return f"{sensor}_{modality}"
+
+
+def _json_fingerprint(fingerprint) -> Any:
+    return json.loads(json.dumps(fingerprint))
+
+
+def build_levels(y: np.ndarray) -> Dict[str, List[np.ndarray]]:
+    """
+    Min/max/mean per bucket for levels 1..K (bucket width 2**k), plus the
+    sample positions of the min and max (the first one on ties, like argmin).
+    NaN samples are ignored; buckets without valid samples are NaN, positioned
+    at their first sample.
+    """
+    y = np.asarray(y, dtype=np.float64).reshape(-1)
+    valid = ~np.isnan(y)
+    lo = np.where(valid, y, np.inf)
+    hi = np.where(valid, y, -np.inf)
+    total = np.where(valid, y, 0.0)
+    count = valid.astype(np.float64)
+    at_lo = at_hi = np.arange(y.size, dtype=np.int32)
+
+    levels: Dict[str, List[np.ndarray]] = {s: [] for s in STATS}
+    while lo.size > MIN_LEVEL_BUCKETS:
+        if lo.size % 2:
+            lo = np.append(lo, np.inf)
+            hi = np.append(hi, -np.inf)
+            total = np.append(total, 0.0)
+            count = np.append(count, 0.0)
+            at_lo = np.append(at_lo, y.size)
+            at_hi = np.append(at_hi, y.size)
+        left_lo = lo[0::2] <= lo[1::2]
+        left_hi = hi[0::2] >= hi[1::2]
+        at_lo = np.where(left_lo, at_lo[0::2], at_lo[1::2])
+        at_hi = np.where(left_hi, at_hi[0::2], at_hi[1::2])
+        lo = np.where(left_lo, lo[0::2], lo[1::2])
+        hi = np.where(left_hi, hi[0::2], hi[1::2])
+        total = total[0::2] + total[1::2]
+        count = count[0::2] + count[1::2]
+        empty = count == 0
+        levels["min"].append(np.where(empty, np.nan, lo).astype(np.float32))
+        levels["max"].append(np.where(empty, np.nan, hi).astype(np.float32))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            levels["mean"].append(np.where(empty, np.nan, total / count).astype(np.float32))
+        levels["argmin"].append(at_lo)
+        levels["argmax"].append(at_hi)
+    return levels
+
+
+def build_subject(subject: str, root: str = DATA_ROOT) -> Tuple[str, int]:
+    """Build and persist pyramids for every modality of a subject."""
+    pkl_path = os.path.join(root, subject, f"{subject}.pkl")
+    obj = load_pkl(pkl_path)
+    out_dir = pyramid_dir(pkl_path)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, PYRAMID_MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    entries: Dict[str, Any] = {}
+    for sensor in obj.sensors():
+        for modality in obj.modalities(sensor):
+            axes = ACC_VARIANTS if modality.upper() == "ACC" else (None,)
+            for axis in axes:
+                series = extract_array(obj, sensor, modality, axis=None if axis == "mag" else axis)
+                levels = build_levels(series["y_values"])
+                if not levels["min"]:
+                    continue
+                name = _entry_name(sensor, modality, axis)
+                for stat in STATS:
+                    np.save(os.path.join(out_dir, f"{name}.{stat}.npy"), np.concatenate(levels[stat]))
+                sizes = [int(level.size) for level in levels["min"]]
+                entries[name] = {
+                    "fs": series["fs"],
+                    "samples": int(series["y_values"].size),
+                    "offsets": [0] + np.cumsum(sizes).tolist()[:-1],
+                    "sizes": sizes,
+                    "chart_title": series["chart_title"],
+                    "x_label": series["x_label"],
+                    "y_label": series["y_label"],
+                }
+
+    manifest = {
+        "version": PYRAMID_VERSION,
+        "subject": subject,
+        "source": _json_fingerprint(subject_fingerprint(pkl_path)),
+        "entries": entries,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return out_dir, len(entries)
+
+
+def _read_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != PYRAMID_VERSION:
+        return None
+    return manifest
+
+
+def _load_manifest(pkl_path: str) -> Optional[Dict[str, Any]]:
+    """Pyramid manifest for the subject, or None if missing or stale."""
+    manifest_path = os.path.join(pyramid_dir(pkl_path), PYRAMID_MANIFEST)
+    try:
+        fingerprint = file_fingerprint(manifest_path)
+    except FileNotFoundError:
+        return None
+    manifest = SUBJECT_CACHE.get_or_load(
+        (manifest_path,), fingerprint, lambda: _read_manifest(manifest_path)
+    )
+    if manifest is None:
+        return None
+    if manifest.get("source") != _json_fingerprint(subject_fingerprint(pkl_path)):
+        return None
+    return manifest
+
+
+def _stat_array(pkl_path: str, name: str, stat: str) -> np.ndarray:
+    path = os.path.join(pyramid_dir(pkl_path), f"{name}.{stat}.npy")
+    return SUBJECT_CACHE.get_or_load(
+        (path,), file_fingerprint(path), lambda: np.load(path, mmap_mode="r")
+    )
+
+
+def query(
+    pkl_path: str,
+    sensor: str,
+    modality: str,
+    axis: Optional[str],
+    target_points: int,
+    method: str = "lttb",
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Answer a downsampled /data/series request from the persisted pyramid.
+    Returns None when no up-to-date pyramid exists for the series, or when the
+    range is short enough that raw samples are the better answer.
+    """
+    manifest = _load_manifest(pkl_path)
+    if manifest is None:
+        return None
+    sensor = sensor.lower()
+    entry = None
+    for name, candidate in manifest["entries"].items():
+        if name.lower() == _entry_name(sensor, modality, axis).lower():
+            entry, entry_name = candidate, name
+            break
+    if entry is None:
+        return None
+
+    fs = entry["fs"]
+    i0, i1 = sample_range(entry["samples"], fs, start_sec, end_sec)
+    if i1 <= i0:
+        return None
+
+    # Envelopes (lttb/minmax) emit two points per bucket, means one.
+    per_bucket = 1 if method == "mean" else 2
+    level = None
+    for k in range(len(entry["sizes"]), 0, -1):
+        if (i1 - i0) / 2 ** k * per_bucket >= target_points:
+            level = k
+            break
+    if level is None:
+        return None
+
+    width = 2 ** level
+    b0, b1 = i0 // width, min(entry["sizes"][level - 1], -(-i1 // width))
+    offset = entry["offsets"][level - 1]
+    starts = np.arange(b0, b1, dtype=np.float64) * width
+    if method == "mean":
+        y = np.asarray(_stat_array(pkl_path, entry_name, "mean")[offset + b0 : offset + b1], dtype=np.float64)
+        x = (starts + width / 2) / fs
+    else:
+        # Each bucket's min and max in the order they occur, at their own
+        # sample positions, as downsampling.minmax emits them from raw samples.
+        y = np.stack([
+            _stat_array(pkl_path, entry_name, "min")[offset + b0 : offset + b1],
+            _stat_array(pkl_path, entry_name, "max")[offset + b0 : offset + b1],
+        ], axis=1).astype(np.float64)
+        at = np.stack([
+            _stat_array(pkl_path, entry_name, "argmin")[offset + b0 : offset + b1],
+            _stat_array(pkl_path, entry_name, "argmax")[offset + b0 : offset + b1],
+        ], axis=1).astype(np.float64)
+        order = np.argsort(at, axis=1, kind="stable")
+        at = np.take_along_axis(at, order, axis=1).reshape(-1)
+        y = np.take_along_axis(y, order, axis=1).reshape(-1)
+        keep = np.concatenate([[True], np.diff(at) != 0])
+        x, y = at[keep] / fs, y[keep]
+    # Edge buckets straddle the requested window; keep their points on its edges.
+    x = np.clip(x, i0 / fs, (i1 - 1) / fs)
+    x, y = downsample(x, y, target_points, method)
+    return {
+        "chart_title": entry["chart_title"],
+        "x_label": entry["x_label"],
+        "y_label": entry["y_label"],
+        "x_values": x,
+        "y_values": y,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build min/max/mean zoom pyramids for WESAD subjects.")
+    parser.add_argument("subjects", nargs="*", help="Subject IDs, e.g. S2 S3 (default: all)")
+    parser.add_argument("--root", default=DATA_ROOT, help="WESAD data folder")
+    args = parser.parse_args(argv)
+
+    for subject in args.subjects or discover_subjects(args.root):
+        t0 = time.perf_counter()
+        try:
+            out_dir, count = build_subject(subject, args.root)
+        except FileNotFoundError as e:
+            print(f"{subject}: missing {e}")
+            continue
+        print(f"{subject}: {count} pyramids in {out_dir} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Common time base for signals recorded at different rates.
+
+WESAD mixes 700 Hz chest signals and labels, 64 Hz BVP, 32 Hz wrist ACC and
+4 Hz EDA/TEMP. Multi-signal analyses put them on one grid t0 + k / fs with
+align_signals() instead of slicing each array by hand:
+
+- "hold":      previous-sample hold (labels and other categorical signals);
+               an integer rate ratio on an aligned grid is a strided view of
+               the stored array, nothing is copied.
+- "polyphase": anti-aliased rational resampling (resample_poly), for
+               continuous signals going down in rate.
+- "linear":    linear interpolation, for going up in rate or for irregular
+               event series (beat-to-beat heart rate, see resample_events).
+- "auto":      identity at the same rate, polyphase down, linear up.
+
+Every method returns exactly n samples; values past the end of a source
+repeat its last sample.
+"""
+import math
+from fractions import Fraction
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from services.pkl_loader import LABEL_FS, SubjectData, row_values, select_rows
+from services.time_range import sample_range
+
+METHODS = ("auto", "hold", "polyphase", "linear")
+
+
+def parse_signal(spec: str) -> Tuple[str, str, Optional[str]]:
+    """'sensor.modality[.axis]' or 'label' -> (sensor, modality, axis)."""
+    parts = spec.strip().split(".")
+    if parts[0].lower() == "label":
+        return "label", "LABEL", None
+    if len(parts) in (2, 3):
+        return parts[0], parts[1], parts[2] if len(parts) == 3 else None
+    raise ValueError(f"Bad signal '{spec}', expected sensor.modality[.axis]")
+
+
+def grid_times(t0: float, n: int, fs: float) -> np.ndarray:
+    return t0 + np.arange(n) / fs
+
+
+def _fit(y: np.ndarray, n: int) -> np.ndarray:
+    """Exactly n samples: trim, or extend by repeating the last one."""
+    if y.shape[0] >= n:
+        return y[:n]
+    if y.shape[0] == 0:
+        return np.full(n, np.nan)
+    return np.concatenate([y, np.repeat(y[-1:], n - y.shape[0], axis=0)])
+
+
+def _integer_step(ratio: float) -> Optional[int]:
+    step = int(round(ratio))
+    return step if step >= 1 and abs(ratio - step) < 1e-9 else None
+
+
+def resample(
+    y,
+    fs: float,
+    target_fs: float,
+    n: Optional[int] = None,
+    method: str = "auto",
+    offset_sec: float = 0.0,
+) -> np.ndarray:
+    """
+    Resample y (sample k at k / fs) onto the grid offset_sec + k / target_fs
+    (n samples; by default as many as cover y). offset_sec must be >= 0.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown resampling method: {method} (expected one of {', '.join(METHODS)})")
+    y = np.asarray(y)
+    fs, target_fs = float(fs), float(target_fs)
+    if n is None:
+        n = max(0, int(math.floor((y.shape[0] / fs - offset_sec) * target_fs + 1e-9)))
+    if method == "auto":
+        method = "hold" if target_fs == fs else ("polyphase" if target_fs < fs else "linear")
+
+    shift = offset_sec * fs
+    first = int(round(shift))
+    on_grid = abs(shift - first) < 1e-6
+
+    if method == "hold":
+        step = _integer_step(fs / target_fs)
+        if step is not None and on_grid:
+            return _fit(y[first::step], n)
+        idx = np.floor(shift + np.arange(n) * (fs / target_fs) + 1e-9).astype(np.int64)
+        return y[np.clip(idx, 0, max(0, y.shape[0] - 1))] if y.shape[0] else np.full(n, np.nan)
+
+    y = y.astype(np.float64, copy=False)
+    if method == "polyphase" and target_fs != fs and y.shape[0] > 0:
+        ratio = Fraction(target_fs / fs).limit_denominator(1000)
+        y = resample_poly(y, ratio.numerator, ratio.denominator, padtype="line", axis=0)
+        fs = fs * ratio.numerator / ratio.denominator
+        shift = offset_sec * fs
+        first = int(round(shift))
+        on_grid = abs(shift - first) < 1e-6
+        if on_grid and abs(fs - target_fs) < 1e-9:
+            return _fit(y[first:], n)
+
+    if y.shape[0] == 0:
+        return np.full(n, np.nan)
+    t_src = np.arange(y.shape[0]) / fs
+    t_dst = offset_sec + np.arange(n) / target_fs
+    if y.ndim == 1:
+        return np.interp(t_dst, t_src, y)
+    return np.stack([np.interp(t_dst, t_src, col) for col in y.T], axis=1)
+
+
+def resample_events(times, values, grid: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation of an irregular series (e.g. beat-to-beat heart rate)
+    onto grid timestamps; the first/last value is held beyond the ends, NaN
+    everywhere when there are no events.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if times.size == 0:
+        return np.full(grid.shape[0], np.nan)
+    return np.interp(grid, times, np.asarray(values, dtype=np.float64))
+
+
+def align_signals(
+    obj: SubjectData,
+    signals: Sequence[str],
+    fs: float,
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    pad_sec: float = 0.0,
+    align_sec: Optional[float] = None,
+    method: str = "auto",
+) -> Dict[str, Any]:
+    """
+    Read several signals of one subject onto the common grid t0 + k / fs.
+
+    The grid covers the part of the recording all signals share, limited to
+    [start_sec - pad_sec, end_sec + pad_sec] (see time_range.sample_range).
+    Labels always use "hold". Returns {"fs", "t0", "n", "values": {spec: array}}
+    with one equal-length array per requested spec.
+    """
+    parsed = [(spec, *parse_signal(spec)) for spec in signals]
+    if not parsed:
+        raise ValueError("No signals requested")
+
+    duration = math.inf
+    for _, sensor, modality, _ in parsed:
+        if sensor == "label":
+            duration = min(duration, len(obj.label()) / LABEL_FS)
+        else:
+            duration = min(duration, obj.meta(sensor, modality)["shape"][0] / obj.sampling_rate(sensor, modality))
+    n_grid = int(math.floor(duration * fs + 1e-9))
+    i0, i1 = sample_range(n_grid, fs, start_sec, end_sec, pad_sec=pad_sec, align_sec=align_sec)
+    t0, n = i0 / fs, i1 - i0
+
+    values = {}
+    for spec, sensor, modality, axis in parsed:
+        # Read from one source sample before t0 to one grid step past the end.
+        rows, meta = select_rows(obj, sensor, modality, axis=axis, start_sec=t0, end_sec=(i1 + 1) / fs)
+        if sensor == "label":
+            # Stored label codes, not floats, so a 700 -> fs step stays a view.
+            y, how = np.asarray(rows).reshape(-1), "hold"
+        else:
+            y, how = row_values(rows, sensor, modality, axis), method
+        values[spec] = resample(y, meta["fs"], fs, n=n, method=how, offset_sec=t0 - meta["t0"])
+    return {"fs": float(fs), "t0": t0, "n": n, "values": values}
@@ -0,0 +1,237 @@
+"""
+On-disk cache for derived results (metric series, health analysis).
+
+@cached_result(version=...) wraps a get_*(subject, ...) service. The key is
+the function, its algorithm version, all its arguments (defaults included) and
+the fingerprint of the subject files it reads, so a changed pickle, columnar
+store or questionnaire simply misses. Bump `version` whenever the algorithm's
+output changes.
+
+Values are pickled (protocol 5: NumPy arrays are stored as raw buffers) into
+one file per entry under RESULT_CACHE_DIR, written atomically, so every
+uvicorn worker on the host and later restarts reuse them. Once the directory
+grows past RESULT_CACHE_MB the least recently used files (mtime, refreshed on
+each hit) are deleted. Hot entries also stay in SUBJECT_CACHE, so a repeated
+hit in the same worker skips the disk read. RESULT_CACHE_MB=0 disables the
+disk layer. Concurrent misses for the same key within one process are
+coalesced into a single computation (IN_FLIGHT, see services/single_flight).
+`service.uncached` calls the undecorated function, for arguments that are
+never repeated (the per-tick ranges of /replay).
+"""
+import functools, hashlib, inspect, json, os, pickle, threading
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from services.pkl_loader import SUBJECT_CACHE
+from services.signal_store import MANIFEST_NAME, columnar_dir
+from services.single_flight import SingleFlight
+from services.subject_cache import file_fingerprint
+
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "data/cache/results")
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MB", "512")) * 1024 * 1024)
+RESULT_SUFFIX = ".pkl"
+# Eviction trims the directory to this fraction of the budget.
+EVICT_TO = 0.9
+
+
+class ResultCache:
+    """Size-bounded directory of pickled results, shared between processes."""
+
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # unknown until the first scan
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + RESULT_SUFFIX)
+
+    def get(self, digest: str) -> Any:
+        """Cached value, or None on a miss (or when the file cannot be read)."""
+        if not self.enabled:
+            return None
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, digest: str, value: Any) -> None:
+        # Best effort: an unwritable cache directory only costs the reuse.
+        if not self.enabled:
+            return
+        path = self._path(digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=5)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.writes += 1
+            if self._bytes is not None:
+                self._bytes += size
+            if self._bytes is None or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(RESULT_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, path))
+        return files
+
+    def _evict(self) -> None:
+        # Other workers write to the same directory, so the total is re-read
+        # from disk whenever the running estimate crosses the budget.
+        files = self._scan()
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+        self._bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in self._scan():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._bytes is None and self.enabled:
+                self._bytes = sum(size for _, size, _ in self._scan())
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "bytes": self._bytes or 0,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+RESULT_CACHE = ResultCache()
+IN_FLIGHT = SingleFlight()
+
+
+def subject_files(subject: str, extra: Sequence[str] = ()) -> list:
+    """Files whose fingerprint keys a subject's results: pickle, store manifest, extras."""
+    path = f"data/WESAD/{subject}/{subject}.pkl"
+    files = [path, os.path.join(columnar_dir(path), MANIFEST_NAME)]
+    return files + [f"data/WESAD/{subject}/{name.format(subject=subject)}" for name in extra]
+
+
+def _normalize(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    # winsec=5 from a caller and 5.0 from a query parameter are the same request.
+    return {
+        k: float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+        for k, v in arguments.items()
+    }
+
+
+def cached_result(
+    version: int, extra_files: Sequence[str] = (), cacheable: Optional[Callable[[Any], bool]] = None
+) -> Callable:
+    """
+    Cache a get_*(subject, ...) service in RESULT_CACHE (and SUBJECT_CACHE).
+    extra_files are file names in the subject folder ("{subject}_quest.csv")
+    that the result also depends on. Exceptions are never cached, and neither
+    are results for which cacheable(result) is false (e.g. partial results).
+    """
+    def decorate(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        def key_of(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            subject = bound.arguments["subject"]
+            # Raises FileNotFoundError for an unknown subject, as load_pkl does.
+            fingerprint = file_fingerprint(*subject_files(subject, extra_files))
+            key = json.dumps(
+                {"fn": name, "version": version, "args": _normalize(bound.arguments), "source": fingerprint},
+                sort_keys=True, default=str,
+            )
+            return hashlib.sha1(key.encode("utf-8")).hexdigest(), fingerprint, bound
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            digest, fingerprint, bound = key_of(args, kwargs)
+
+            def load():
+                value = RESULT_CACHE.get(digest)
+                if value is None:
+                    value = func(*bound.args, **bound.kwargs)
+                    if cacheable is None or cacheable(value):
+                        RESULT_CACHE.put(digest, value)
+                return value
+
+            # Concurrent identical calls in this process share one computation.
+            value = IN_FLIGHT.run(
+                digest, lambda: SUBJECT_CACHE.get_or_load(("result", digest), fingerprint, load, cacheable)
+            )
+            # Callers may add or replace keys; the cached dict stays intact.
+            return dict(value) if isinstance(value, dict) else value
+
+        def peek(*args, **kwargs):
+            """The cached result for these arguments, or None; never computes."""
+            try:
+                digest, fingerprint, _ = key_of(args, kwargs)
+            except (FileNotFoundError, TypeError):
+                return None
+            value = SUBJECT_CACHE.peek(("result", digest), fingerprint)
+            if value is None:
+                value = RESULT_CACHE.get(digest)
+                if value is None:
+                    return None
+                SUBJECT_CACHE.put(("result", digest), fingerprint, value)
+            return dict(value) if isinstance(value, dict) else value
+
+        wrapper.peek = peek
+        # For one-off arguments that are never asked for twice (replay ticks).
+        wrapper.uncached = func
+        wrapper.cache_key = lambda *args, **kwargs: key_of(args, kwargs)[0]
+        wrapper.cache_version = version
+        return wrapper
+
+    return decorate
@@ -0,0 +1,172 @@
+"""
+Columnar, memory-mapped storage for WESAD subjects.
+
+A subject pickle (data/WESAD/S2/S2.pkl) is split into one .npy file per
+sensor/modality plus a manifest.json, all stored in data/WESAD/S2/S2_columnar/.
+Signals are written as little-endian float32, labels keep their integer dtype.
+The manifest records shapes, dtypes and the sampling rate stored with each
+signal (null when the pickle had none, so readers apply DEFAULT_FS as before).
+Arrays are opened with mmap_mode="r", so a request only pages in the samples it
+actually reads instead of unpickling the whole recording.
+
+Convert subjects (run from the backend folder):
+    python -m services.signal_store            # every subject under data/WESAD
+    python -m services.signal_store S2 S3      # selected subjects
+"""
+import argparse, json, os, pickle, time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+STORE_VERSION = 2
+STORE_SUFFIX = "_columnar"
+MANIFEST_NAME = "manifest.json"
+SIGNAL_DTYPE = "<f4"
+DATA_ROOT = "data/WESAD"
+
+
+def columnar_dir(pkl_path: str) -> str:
+    """data/WESAD/S2/S2.pkl -> data/WESAD/S2/S2_columnar"""
+    return os.path.splitext(pkl_path)[0] + STORE_SUFFIX
+
+
+def _source_stat(pkl_path: str) -> Optional[Dict[str, int]]:
+    try:
+        st = os.stat(pkl_path)
+    except FileNotFoundError:
+        return None
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def read_manifest(store_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != STORE_VERSION:
+        return None
+    return manifest
+
+
+def has_fresh_store(pkl_path: str) -> bool:
+    """
+    True when a complete columnar store exists for the pickle and was built from
+    the pickle currently on disk. A store without its source pickle is still
+    considered valid, so pickles can be removed after conversion.
+    """
+    manifest = read_manifest(columnar_dir(pkl_path))
+    if manifest is None:
+        return False
+    src = _source_stat(pkl_path)
+    return src is None or src == manifest.get("source")
+
+
+def open_array(store_dir: str, entry: Dict[str, Any]) -> np.ndarray:
+    """Memory-map one array described by a manifest entry."""
+    return np.load(os.path.join(store_dir, entry["file"]), mmap_mode="r")
+
+
+def _write_array(store_dir: str, name: str, arr: np.ndarray) -> Dict[str, Any]:
+    filename = f"{name}.npy"
+    np.save(os.path.join(store_dir, filename), arr, allow_pickle=False)
+    return {"file": filename, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+
+
+def convert_pkl(pkl_path: str, force: bool = False) -> Optional[str]:
+    """
+    Convert one subject pickle into its columnar store. Returns the store
+    directory, or None when an up-to-date store already exists.
+    """
+    # Imported here: pkl_loader imports this module at load time.
+    from services.pkl_loader import LABEL_FS
+
+    if not os.path.exists(pkl_path):
+        raise FileNotFoundError(pkl_path)
+    if not force and has_fresh_store(pkl_path):
+        return None
+
+    store_dir = columnar_dir(pkl_path)
+    os.makedirs(store_dir, exist_ok=True)
+    # The manifest is written last, so a half-written store is never loaded.
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    source = _source_stat(pkl_path)
+    with open(pkl_path, "rb") as f:
+        obj = pickle.load(f, encoding="latin1")
+
+    signals: Dict[str, Dict[str, Any]] = {}
+    for sensor, block in (obj.get("signal") or {}).items():
+        signals[sensor] = {}
+        for modality, payload in block.items():
+            if isinstance(payload, dict) and "signal" in payload:
+                raw = payload["signal"]
+                fs = payload.get("sampling_rate")
+            else:
+                raw = payload
+                fs = None
+            arr = np.ascontiguousarray(np.asarray(raw, dtype=SIGNAL_DTYPE))
+            entry = _write_array(store_dir, f"{sensor}_{modality}", arr)
+            entry["sampling_rate"] = fs
+            signals[sensor][modality] = entry
+
+    label_entry = None
+    if obj.get("label") is not None:
+        label = np.ascontiguousarray(np.asarray(obj["label"]))
+        label_entry = _write_array(store_dir, "label", label)
+        label_entry["sampling_rate"] = LABEL_FS
+
+    manifest = {
+        "version": STORE_VERSION,
+        "subject": obj.get("subject"),
+        "source": source,
+        "signals": signals,
+        "label": label_entry,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return store_dir
+
+
+def discover_subjects(root: str = DATA_ROOT) -> List[str]:
+    """Subject IDs that have a {S}/{S}.pkl or a converted store under root."""
+    if not os.path.isdir(root):
+        return []
+    subjects = []
+    for name in sorted(os.listdir(root)):
+        pkl_path = os.path.join(root, name, f"{name}.pkl")
+        if os.path.exists(pkl_path) or read_manifest(columnar_dir(pkl_path)):
+            subjects.append(name)
+    return subjects
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert WESAD subject pickles into memory-mappable columnar stores."
+    )
+    parser.add_argument("subjects", nargs="*", help="Subject IDs, e.g. S2 S3 (default: all)")
+    parser.add_argument("--root", default=DATA_ROOT, help="WESAD data folder")
+    parser.add_argument("--force", action="store_true", help="Rebuild up-to-date stores")
+    args = parser.parse_args(argv)
+
+    subjects = args.subjects or discover_subjects(args.root)
+    for subject in subjects:
+        pkl_path = os.path.join(args.root, subject, f"{subject}.pkl")
+        t0 = time.perf_counter()
+        try:
+            store_dir = convert_pkl(pkl_path, force=args.force)
+        except FileNotFoundError:
+            print(f"{subject}: missing {pkl_path}")
+            continue
+        if store_dir is None:
+            print(f"{subject}: up to date")
+        else:
+            print(f"{subject}: wrote {store_dir} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Byte-budgeted LRU cache for loaded subject data.
+
+Entries are sized by the NumPy arrays and Python objects they hold and evicted
+least-recently-used first once the configured budget is exceeded. Every entry remembers the
+fingerprint (size, mtime) of the file it was loaded from, and is reloaded when
+the file on disk changes. Memory-mapped arrays are tracked separately: their
+pages belong to the OS page cache, so they do not count against the budget.
+"""
+import os, sys, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("SUBJECT_CACHE_MB", "2048")) * 1024 * 1024)
+
+Fingerprint = Tuple[Any, ...]
+
+
+def file_fingerprint(*paths: str) -> Fingerprint:
+    """
+    (size, mtime_ns) for every path that exists. Raises FileNotFoundError when
+    none of them exist.
+    """
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            parts.append(None)
+            continue
+        parts.append((int(st.st_size), int(st.st_mtime_ns)))
+    if all(p is None for p in parts):
+        raise FileNotFoundError(paths[0] if paths else "")
+    return tuple(parts)
+
+
+def sizeof(value: Any) -> Tuple[int, int]:
+    """
+    Return (heap_bytes, mapped_bytes) of a value: NumPy arrays count their
+    buffers, dicts / lists / scalars their Python object size. A list whose
+    first item is a scalar is charged len * the size of that item, so long
+    lists of floats cost O(1) to measure.
+    """
+    if isinstance(value, np.memmap):
+        return 0, int(value.nbytes)
+    if isinstance(value, np.ndarray):
+        base = value
+        while isinstance(base, np.ndarray) and base.base is not None:
+            base = base.base
+        if isinstance(base, np.memmap):
+            return 0, int(value.nbytes)
+        return int(value.nbytes), 0
+    if isinstance(value, dict):
+        items = value.values()
+        heap = sys.getsizeof(value) + sum(sys.getsizeof(k) for k in value)
+    elif isinstance(value, (list, tuple)):
+        items = value
+        heap = sys.getsizeof(value)
+        if value and not isinstance(value[0], (np.ndarray, dict, list, tuple)):
+            return heap + len(value) * sys.getsizeof(value[0]), 0
+    else:
+        return sys.getsizeof(value), 0
+    mapped = 0
+    for item in items:
+        h, m = sizeof(item)
+        heap += h
+        mapped += m
+    return heap, mapped
+
+
+class _Entry:
+    __slots__ = ("value", "fingerprint", "nbytes", "mapped_bytes")
+
+    def __init__(self, value: Any, fingerprint: Fingerprint, nbytes: int, mapped_bytes: int):
+        self.value = value
+        self.fingerprint = fingerprint
+        self.nbytes = nbytes
+        self.mapped_bytes = mapped_bytes
+
+
+class SubjectCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._mapped_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.oversized = 0
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        fingerprint: Fingerprint,
+        loader: Callable[[], Any],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Return the cached value for key if its fingerprint still matches,
+        otherwise call loader() and cache the result within the byte budget
+        (unless cacheable(result) is false).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint == fingerprint:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        # Load outside the lock so slow disk reads don't block other subjects.
+        value = loader()
+
+        if cacheable is None or cacheable(value):
+            self.put(key, fingerprint, value)
+        return value
+
+    def peek(self, key: Hashable, fingerprint: Fingerprint) -> Optional[Any]:
+        """Cached value for key if present and current, else None (never loads)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.fingerprint != fingerprint:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, fingerprint: Fingerprint, value: Any) -> None:
+        """Insert a value loaded as a side effect of another lookup."""
+        nbytes, mapped_bytes = sizeof(value)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                self.oversized += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, fingerprint, nbytes, mapped_bytes)
+            self._bytes += nbytes
+            self._mapped_bytes += mapped_bytes
+            self._evict()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._mapped_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "mapped_bytes": self._mapped_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "oversized": self.oversized,
+                "keys": [str(k) for k in self._entries.keys()],
+            }
+
+    def _remove(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+            self._mapped_bytes -= entry.mapped_bytes
+        return entry
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
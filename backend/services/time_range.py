@@ -0,0 +1,72 @@
+"""
+Helpers for answering a request over a time window [start_sec, end_sec]
+without processing the whole recording.
+
+Services slice the raw arrays with sample_range() before doing any work, run
+their usual computation on the slice, then move the timestamps back onto the
+recording's time axis and drop points outside the window with clip_result().
+"""
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def sample_range(
+    n: int,
+    fs: float,
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    pad_sec: float = 0.0,
+    align_sec: Optional[float] = None,
+) -> Tuple[int, int]:
+    """
+    Sample indices [i0, i1) of an n-sample signal at fs covering
+    [start_sec - pad_sec, end_sec + pad_sec].
+
+    pad_sec gives filters (filtfilt, smoothing) and windows that straddle the
+    edges enough context. align_sec is the window step of the caller: i0 is
+    moved back onto a multiple of the step in samples (rounded like
+    windowing.window_length), so windows computed from i0 line up with the
+    windows the same service produces for the full recording. Without a range
+    this is (0, n).
+    """
+    if start_sec is None and end_sec is None:
+        return 0, n
+    t_start = max(0.0, (start_sec or 0.0) - pad_sec)
+    i0 = min(n, int(math.floor(t_start * fs)))
+    if align_sec:
+        step = max(1, int(round(align_sec * fs)))
+        i0 = (i0 // step) * step
+    if end_sec is None:
+        i1 = n
+    else:
+        i1 = min(n, int(math.ceil((end_sec + pad_sec) * fs)) + 1)
+    return i0, max(i0, i1)
+
+
+def clip_result(
+    result: Dict[str, Any],
+    offset_sec: float,
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Shift a {x_values, y_values} result by offset_sec and keep the points
+    whose timestamp falls inside [start_sec, end_sec]. ndarray values stay
+    ndarrays; lists come back as lists.
+    """
+    if start_sec is None and end_sec is None and offset_sec == 0:
+        return result
+    x = np.asarray(result["x_values"], dtype=np.float64) + offset_sec
+    y = np.asarray(result["y_values"], dtype=np.float64)
+    keep = np.ones(x.size, dtype=bool)
+    if start_sec is not None:
+        keep &= x >= start_sec
+    if end_sec is not None:
+        keep &= x <= end_sec
+    out = dict(result)
+    as_array = isinstance(result["y_values"], np.ndarray)
+    out["x_values"] = x[keep] if as_array else x[keep].tolist()
+    out["y_values"] = y[keep] if as_array else y[keep].tolist()
+    return out
@@ -0,0 +1,206 @@
+"""
+Binary encodings for time series responses.
+
+Clients opt in with the Accept header; JSON stays the default.
+
+application/octet-stream (all integers little-endian):
+    4 bytes   magic b"WSB1"
+    uint32    length of the JSON header in bytes
+    bytes     UTF-8 JSON header:
+                {"version", "count", "fs", "t0", "dtype", "x_dtype",
+                 "labels": {"chart_title", "x_label", "y_label"}}
+    padding   zero bytes up to a multiple of 8
+    float32   y values (count), zero-padded to a multiple of 8 bytes
+    float64   x values (count), only when "x_dtype" is set
+
+Uniformly sampled series carry no x values: sample i is at t0 + i / fs.
+Series with irregular timestamps (e.g. heart rate windows that were skipped)
+set "fs" to null and ship x as float64.
+
+application/vnd.apache.arrow.stream: one record batch with a float32 "y" column
+(plus a float64 "x" column for irregular series) and the same header stored in
+the schema metadata under b"series". Requires pyarrow; without it the format is
+simply not offered during negotiation.
+
+Streamed series (/data/series?stream=true) are sent in chunks:
+
+application/x-ndjson (default): one JSON object per line, each a regular JSON
+    series ({chart_title, x_label, y_label, x_values, y_values}) covering the
+    next block of samples.
+application/octet-stream: a sequence of the binary payloads above, one per
+    chunk, each zero-padded to a multiple of 8 bytes (see decode_frames).
+"""
+import json, struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services.json_response import dumps
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+JSON_MEDIA_TYPE = "application/json"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+MAGIC = b"WSB1"
+WIRE_VERSION = 1
+_LABEL_KEYS = ("chart_title", "x_label", "y_label")
+
+
+def available_media_types() -> Tuple[str, ...]:
+    if pa is None:
+        return (JSON_MEDIA_TYPE, BINARY_MEDIA_TYPE)
+    return (JSON_MEDIA_TYPE, BINARY_MEDIA_TYPE, ARROW_MEDIA_TYPE)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Pick the response media type from an Accept header. Highest q wins, ties
+    go to the order the client listed them; */* and unknown types mean JSON.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    offered = available_media_types()
+    best, best_q = JSON_MEDIA_TYPE, -1.0
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media not in offered or q <= 0:
+            continue
+        if q > best_q:
+            best, best_q = media, q
+    return best
+
+
+def _timing(series: Dict[str, Any]) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[float], float]:
+    """
+    Return (y, x or None, fs, t0). extract_array results carry dt/t0; plain
+    results carry x_values, which are dropped when they are evenly spaced.
+    """
+    y = np.asarray(series["y_values"], dtype=np.float64).reshape(-1)
+    if "dt" in series:
+        return y, None, 1.0 / series["dt"], float(series.get("t0", 0.0))
+
+    x = np.asarray(series.get("x_values", []), dtype=np.float64).reshape(-1)
+    if x.size == 0:
+        return y, None, None, 0.0
+    if x.size == 1:
+        return y, None, None, float(x[0])
+    steps = np.diff(x)
+    step = float(steps[0])
+    if step > 0 and np.allclose(steps, step, rtol=1e-9, atol=1e-9):
+        return y, None, 1.0 / step, float(x[0])
+    return y, x, None, float(x[0])
+
+
+def _header(series: Dict[str, Any], count: int, fs: Optional[float], t0: float, has_x: bool) -> Dict[str, Any]:
+    return {
+        "version": WIRE_VERSION,
+        "count": count,
+        "fs": fs,
+        "t0": t0,
+        "dtype": "<f4",
+        "x_dtype": "<f8" if has_x else None,
+        "labels": {k: series.get(k) for k in _LABEL_KEYS if series.get(k) is not None},
+    }
+
+
+def encode_binary(series: Dict[str, Any]) -> bytes:
+    y, x, fs, t0 = _timing(series)
+    header = json.dumps(_header(series, int(y.size), fs, t0, x is not None)).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 8)
+    parts = [prefix, y.astype("<f4").tobytes()]
+    if x is not None:
+        parts.append(b"\0" * (-4 * y.size % 8))
+        parts.append(x.astype("<f8").tobytes())
+    return b"".join(parts)
+
+
+def encode_arrow(series: Dict[str, Any]) -> bytes:
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    y, x, fs, t0 = _timing(series)
+    header = _header(series, int(y.size), fs, t0, x is not None)
+    columns = {"y": pa.array(y.astype(np.float32))}
+    if x is not None:
+        columns["x"] = pa.array(x)
+    batch = pa.RecordBatch.from_pydict(
+        columns, metadata={b"series": json.dumps(header).encode("utf-8")}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_binary(payload: bytes) -> Dict[str, Any]:
+    """Inverse of encode_binary; handy for scripts and offline analysis."""
+    if payload[:4] != MAGIC:
+        raise ValueError("not a WSB1 payload")
+    (header_len,) = struct.unpack_from("<I", payload, 4)
+    header = json.loads(payload[8 : 8 + header_len].decode("utf-8"))
+    offset = 8 + header_len
+    offset += -offset % 8
+    count = header["count"]
+    y = np.frombuffer(payload, dtype="<f4", count=count, offset=offset)
+    if header.get("x_dtype"):
+        x_offset = offset + 4 * count
+        x_offset += -x_offset % 8
+        x = np.frombuffer(payload, dtype="<f8", count=count, offset=x_offset)
+    else:
+        x = header["t0"] + np.arange(count) / header["fs"] if header.get("fs") else np.full(count, header["t0"])
+    return {"header": header, "x_values": x, "y_values": y}
+
+
+def encode(series: Dict[str, Any], media_type: str) -> bytes:
+    if media_type == ARROW_MEDIA_TYPE:
+        return encode_arrow(series)
+    return encode_binary(series)
+
+
+def iter_ndjson(chunks: Iterable[Dict[str, Any]], precision: Optional[int] = None) -> Iterator[bytes]:
+    """One JSON line per extract_array chunk (floats rounded to precision decimals)."""
+    for series in chunks:
+        y = np.asarray(series["y_values"], dtype=np.float64)
+        line = {k: series.get(k) for k in _LABEL_KEYS}
+        line["x_values"] = series["t0"] + np.arange(y.size) * series["dt"]
+        line["y_values"] = y
+        yield dumps(line, precision) + b"\n"
+
+
+def iter_binary_frames(chunks: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """One encode_binary payload per chunk, padded to 8 bytes."""
+    for series in chunks:
+        frame = encode_binary(series)
+        yield frame + b"\0" * (-len(frame) % 8)
+
+
+def decode_frames(payload: bytes) -> List[Dict[str, Any]]:
+    """Split a streamed application/octet-stream body back into decoded chunks."""
+    frames = []
+    offset = 0
+    while offset < len(payload):
+        (header_len,) = struct.unpack_from("<I", payload, offset + 4)
+        header = json.loads(payload[offset + 8 : offset + 8 + header_len].decode("utf-8"))
+        size = 8 + header_len
+        size += -size % 8
+        size += 4 * header["count"]
+        size += -size % 8
+        if header.get("x_dtype"):
+            size += 8 * header["count"]
+        frames.append(decode_binary(payload[offset : offset + size]))
+        offset += size
+    return frames
@@ -0,0 +1,86 @@
+"""
+Downsampling must keep the shape of a series: its extremes, its time order
+and its gaps (NaN samples never win a bucket or poison its neighbours).
+
+Run from the backend folder: python -m pytest
+"""
+import numpy as np
+import pytest
+
+from services.downsampling import downsample, downsample_series, lttb, mean, minmax
+
+
+def _signal(n=10_000, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.sin(np.linspace(0, 40 * np.pi, n)) + rng.normal(scale=0.05, size=n)
+    y[1234] = 8.0  # a spike every method but mean must keep
+    y[8765] = -8.0
+    return y
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_envelopes_keep_extremes_in_time_order(method):
+    y = _signal()
+    x, ys = downsample(None, y, 500, method)
+    assert x.size <= 500
+    assert np.all(np.diff(x) > 0)
+    assert 1234 in x and 8765 in x
+    np.testing.assert_array_equal(ys, y[x.astype(int)])
+
+
+def test_lttb_keeps_endpoints_and_target_size():
+    y = _signal()
+    x, ys = lttb(np.arange(y.size) * 0.5, y, 300)
+    assert x.size == 300
+    assert x[0] == 0.0 and x[-1] == (y.size - 1) * 0.5
+
+
+def test_minmax_emits_min_and_max_of_every_bucket():
+    y = _signal()
+    x, ys = minmax(None, y, 200)
+    width = -(-y.size // 100)
+    for b in range(0, y.size // width):
+        bucket = y[b * width : (b + 1) * width]
+        inside = ys[(x >= b * width) & (x < (b + 1) * width)]
+        assert inside.min() == bucket.min() and inside.max() == bucket.max()
+
+
+def test_mean_matches_bucket_averages():
+    y = np.arange(100, dtype=np.float64)
+    x, ys = mean(None, y, 10)
+    np.testing.assert_allclose(ys, np.arange(10) * 10 + 4.5)
+    np.testing.assert_allclose(x, ys)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax", "mean"])
+def test_nan_gaps_are_ignored(method):
+    y = _signal()
+    y[3000:3400] = np.nan
+    y[1::97] = np.nan
+    x, ys = downsample(None, y, 500, method)
+    gap = (x >= 3000) & (x < 3400)
+    # Only buckets lying entirely inside the gap may come out as NaN.
+    assert not np.isnan(ys[~gap]).any()
+    if method != "mean":
+        assert 1234 in x and 8765 in x
+
+
+def test_lttb_does_not_pick_nan():
+    y = _signal()
+    y[5000] = np.nan  # np.argmax would pick the NaN area of its bucket
+    x, ys = lttb(None, y, 500)
+    assert 5000 not in x
+    assert not np.isnan(ys).any()
+
+
+def test_downsample_series_scales_evenly_spaced_input():
+    series = {"chart_title": "ECG", "fs": 100.0, "t0": 2.0, "dt": 0.01, "y_values": _signal()}
+    out = downsample_series(series, 400, "lttb")
+    assert "dt" not in out and "fs" not in out
+    assert out["x_values"][0] == 2.0
+    assert 2.0 + 1234 * 0.01 in out["x_values"]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        downsample(None, _signal(), 100, "median")
@@ -0,0 +1,133 @@
+"""
+Conditional GET and compression, stacked as in app.py: compression wraps the
+ETag middleware, so a 304 is sent bare and a 200 is tagged and then
+compressed.
+
+Run from the backend folder: python -m pytest
+"""
+import gzip, os, time, zlib
+from email.utils import formatdate
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from services.compression import CompressionMiddleware
+from services.http_cache import ConditionalGetMiddleware
+from services.json_response import NumpyJSONResponse
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def _app() -> FastAPI:
+    app = FastAPI(default_response_class=NumpyJSONResponse)
+
+    @app.get("/data/series")
+    def series(subject: str = "S2", points: int = 5000):
+        return NumpyJSONResponse({"subject": subject, "y_values": np.linspace(0, 1, points)})
+
+    @app.get("/data/health_analysis")
+    def partial(subject: str = "S2"):
+        return NumpyJSONResponse({"failed_metrics": ["stress_level"]}, headers={"Cache-Control": "no-store"})
+
+    @app.get("/data/info")
+    def missing(subject: str = "S2"):
+        return PlainTextResponse("not found", status_code=404)
+
+    @app.get("/data/temperature")
+    def binary(subject: str = "S2"):
+        return Response(b"\0" * 5000, media_type="application/octet-stream")
+
+    @app.get("/data/cohort")
+    def stream():
+        return StreamingResponse((f'{{"line": {i}}}\n' for i in range(500)), media_type="application/x-ndjson")
+
+    # Same order as app.py: the last one added is the outermost.
+    app.add_middleware(ConditionalGetMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    return app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/WESAD/S2")
+    with open("data/WESAD/S2/S2.pkl", "wb") as f:
+        f.write(b"recording")
+    return TestClient(_app())
+
+
+def test_tagged_then_compressed(client):
+    r = client.get("/data/series", headers=GZIP)
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].startswith('W/"')
+    assert "last-modified" in r.headers and "must-revalidate" in r.headers["cache-control"]
+    assert {"accept", "accept-encoding"} <= {v.strip().lower() for v in r.headers["vary"].split(",")}
+    assert len(r.json()["y_values"]) == 5000
+    assert int(r.headers["content-length"]) < len(r.content)
+
+
+def test_if_none_match_gets_a_bare_304(client):
+    etag = client.get("/data/series", headers=GZIP).headers["etag"]
+    for validator in (etag, etag[2:], f'"other", {etag}'):
+        r = client.get("/data/series", headers={**GZIP, "If-None-Match": validator})
+        assert r.status_code == 304
+        assert r.content == b""
+        assert "content-encoding" not in r.headers
+        assert r.headers["etag"] == etag
+    # The validator covers the encoded and the identity representation.
+    assert client.get("/data/series", headers={"Accept-Encoding": "identity"}).headers["etag"] == etag
+
+
+def test_etag_follows_query_accept_and_source(client):
+    etag = client.get("/data/series").headers["etag"]
+    assert client.get("/data/series?points=10").headers["etag"] != etag
+    assert client.get("/data/series", headers={"Accept": "application/octet-stream"}).headers["etag"] != etag
+    with open("data/WESAD/S2/S2.pkl", "ab") as f:
+        f.write(b" reconverted")
+    r = client.get("/data/series", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+
+def test_if_modified_since(client):
+    assert client.get("/data/series", headers={"If-Modified-Since": formatdate(time.time() + 60, usegmt=True)}).status_code == 304
+    assert client.get("/data/series", headers={"If-Modified-Since": formatdate(0, usegmt=True)}).status_code == 200
+    # If-None-Match wins when both are sent.
+    r = client.get("/data/series", headers={
+        "If-None-Match": '"stale"', "If-Modified-Since": formatdate(time.time() + 60, usegmt=True),
+    })
+    assert r.status_code == 200
+
+
+def test_untagged_responses(client):
+    partial = client.get("/data/health_analysis")
+    assert partial.headers["cache-control"] == "no-store" and "etag" not in partial.headers
+    assert "etag" not in client.get("/data/info").headers
+    assert "etag" not in client.get("/data/series?subject=S404").headers
+
+
+def test_compression_skips_small_and_binary_bodies(client):
+    small = client.get("/data/series?points=3", headers=GZIP)
+    assert "content-encoding" not in small.headers and "etag" in small.headers
+    binary = client.get("/data/temperature", headers=GZIP)
+    assert "content-encoding" not in binary.headers and len(binary.content) == 5000
+
+
+def test_streams_are_compressed_chunk_by_chunk(client):
+    with client.stream("GET", "/data/cohort", headers=GZIP) as r:
+        assert r.headers["content-encoding"] == "gzip" and "content-length" not in r.headers
+        raw = b"".join(r.iter_raw())
+    lines = gzip.decompress(raw).decode().splitlines()
+    assert lines[0] == '{"line": 0}' and len(lines) == 500
+    # Every chunk is flushed, so a partial body already decodes.
+    assert zlib.decompressobj(31).decompress(raw[: len(raw) // 2]).startswith(b'{"line": 0}\n')
+
+
+def test_app_stacks_compression_outside_conditional_get():
+    from app import app
+
+    order = [m.cls for m in app.user_middleware]
+    assert order.index(CompressionMiddleware) < order.index(ConditionalGetMiddleware)
@@ -0,0 +1,32 @@
+"""
+Pyramid levels must point at the samples they summarise, so envelopes read
+from a pyramid keep the time order of the raw signal.
+
+Run from the backend folder: python -m pytest
+"""
+import numpy as np
+import pytest
+
+from services.pyramid import build_levels
+
+
+@pytest.mark.parametrize("n", [5000, 4097])
+def test_levels_record_min_max_positions(n):
+    rng = np.random.default_rng(0)
+    y = np.cumsum(rng.normal(size=n))
+    y[700:760] = np.nan
+    levels = build_levels(y)
+    for k, (lo, hi, at_lo, at_hi) in enumerate(
+        zip(levels["min"], levels["max"], levels["argmin"], levels["argmax"]), start=1
+    ):
+        width = 2 ** k
+        buckets = -(-n // width)
+        np.testing.assert_array_equal(at_lo[:buckets] // width, np.arange(buckets))
+        np.testing.assert_array_equal(at_hi[:buckets] // width, np.arange(buckets))
+        valid = ~np.isnan(lo[:buckets])
+        np.testing.assert_allclose(y[at_lo[:buckets][valid]], lo[:buckets][valid], rtol=1e-6)
+        np.testing.assert_allclose(y[at_hi[:buckets][valid]], hi[:buckets][valid], rtol=1e-6)
+        # The first valid sample wins ties, like np.argmin / np.argmax.
+        for b in np.flatnonzero(valid)[:50]:
+            bucket = np.where(np.isnan(y[b * width : (b + 1) * width]), np.inf, y[b * width : (b + 1) * width])
+            assert at_lo[b] == b * width + np.argmin(bucket)
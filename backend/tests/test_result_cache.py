@@ -0,0 +1,129 @@
+"""
+The result cache must miss whenever the answer could differ (new algorithm
+version, changed source file) and stay within its byte budget by dropping the
+least recently used entries.
+
+Run from the backend folder: python -m pytest
+"""
+import os, pickle
+
+import pytest
+
+from services import result_cache
+from services.pkl_loader import SUBJECT_CACHE
+from services.result_cache import ResultCache, cached_result
+
+PAYLOAD = b"x" * 1000
+
+
+@pytest.fixture
+def subject(tmp_path, monkeypatch):
+    """A subject folder under a temporary working directory and an empty cache."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/WESAD/SX")
+    with open("data/WESAD/SX/SX.pkl", "wb") as f:
+        f.write(b"recording")
+    monkeypatch.setattr(result_cache, "RESULT_CACHE", ResultCache(str(tmp_path / "results"), 1 << 20))
+    SUBJECT_CACHE.clear()
+    yield "SX"
+    SUBJECT_CACHE.clear()
+
+
+def _service(version, calls, **options):
+    @cached_result(version=version, **options)
+    def get_value(subject, scale=1.0):
+        calls.append(scale)
+        return {"subject": subject, "value": 2 * scale}
+
+    return get_value
+
+
+def test_repeated_calls_hit(subject):
+    calls = []
+    get_value = _service(1, calls)
+    assert get_value(subject, 5) == {"subject": "SX", "value": 10.0}
+    # 5 and 5.0 are the same request; callers get copies of the cached dict.
+    first = get_value(subject, 5.0)
+    first["value"] = -1
+    assert get_value(subject, scale=5) == {"subject": "SX", "value": 10.0}
+    assert calls == [5]
+
+
+def test_version_bump_misses(subject):
+    calls = []
+    _service(1, calls)(subject)
+    assert _service(1, calls).peek(subject) is not None
+    assert _service(2, calls).peek(subject) is None
+    _service(2, calls)(subject)
+    assert len(calls) == 2
+    assert _service(2, calls).cache_key(subject) != _service(1, calls).cache_key(subject)
+
+
+def test_disk_layer_survives_memory_cache(subject):
+    calls = []
+    _service(1, calls)(subject)
+    SUBJECT_CACHE.clear()  # as in another worker or after a restart
+    _service(1, calls)(subject)
+    assert calls == [1.0]
+    assert result_cache.RESULT_CACHE.stats()["hits"] == 1
+
+
+def test_changed_source_misses(subject):
+    calls = []
+    get_value = _service(1, calls)
+    get_value(subject)
+    with open("data/WESAD/SX/SX.pkl", "ab") as f:
+        f.write(b" reconverted")
+    assert get_value.peek(subject) is None
+    get_value(subject)
+    assert len(calls) == 2
+
+
+def test_errors_and_uncacheable_results_are_not_stored(subject):
+    calls = []
+
+    @cached_result(version=1)
+    def get_failing(subject):
+        calls.append(1)
+        raise KeyError("EDA")
+
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            get_failing(subject)
+    get_partial = _service(1, calls, cacheable=lambda value: value["value"] > 100)
+    get_partial(subject)
+    get_partial(subject)
+    assert len(calls) == 4
+    assert result_cache.RESULT_CACHE.stats()["writes"] == 0
+
+
+def test_unknown_subject_raises(subject):
+    with pytest.raises(FileNotFoundError):
+        _service(1, [])("S404")
+
+
+def _put(cache, digest, mtime):
+    cache.put(digest, PAYLOAD)
+    path = cache._path(digest)
+    os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    size = len(pickle.dumps(PAYLOAD, protocol=5))
+    cache = ResultCache(str(tmp_path), max_bytes=int(3.5 * size))
+    paths = {d: _put(cache, d, i * 10**9) for i, d in enumerate(["aa01", "bb02", "cc03"], start=1)}
+    assert cache.get("aa01") == PAYLOAD  # a hit refreshes the entry
+    _put(cache, "dd04", 4 * 10**9)
+    assert not os.path.exists(paths["bb02"])
+    assert all(os.path.exists(paths[d]) for d in ("aa01", "cc03"))
+    assert cache.get("bb02") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 3 * size <= stats["max_bytes"]
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResultCache(str(tmp_path / "off"), max_bytes=0)
+    cache.put("aa01", PAYLOAD)
+    assert cache.get("aa01") is None
+    assert not os.path.exists(tmp_path / "off")
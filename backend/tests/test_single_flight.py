@@ -0,0 +1,109 @@
+"""
+Concurrent callers with the same key must share one computation (result or
+exception), and nothing may outlive it.
+
+Run from the backend folder: python -m pytest
+"""
+import asyncio, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.single_flight import AsyncSingleFlight, SingleFlight
+
+CALLERS = 8
+
+
+def _run_blocked(flight, compute, key="k"):
+    """Start CALLERS threads on one key while compute is held, then release it."""
+    release = threading.Event()
+    entered = threading.Event()
+
+    def held():
+        entered.set()
+        release.wait(5)
+        return compute()
+
+    def call():
+        try:
+            return flight.run(key, held)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(call)]
+        entered.wait(5)
+        futures += [pool.submit(call) for _ in range(CALLERS - 1)]
+        # Every late caller is waiting on the owner's future before release.
+        while flight.stats()["coalesced"] < CALLERS - 1:
+            time.sleep(0.001)
+        release.set()
+        return [f.result() for f in futures]
+
+
+def test_threads_share_one_result():
+    flight, runs = SingleFlight(), []
+    results = _run_blocked(flight, lambda: runs.append(1) or object())
+    assert len(runs) == 1
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": CALLERS - 1}
+
+
+def test_threads_share_one_exception():
+    flight = SingleFlight()
+
+    def fail():
+        raise KeyError("EDA")
+
+    results = _run_blocked(flight, fail)
+    assert all(isinstance(r, KeyError) for r in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_finished_calls_are_not_kept():
+    flight = SingleFlight()
+    assert flight.run("k", lambda: 1) == 1
+    assert flight.run("k", lambda: 2) == 2
+    assert flight.run("other", lambda: 3) == 3
+    assert flight.stats() == {"in_flight": 0, "calls": 3, "coalesced": 0}
+
+
+def test_coroutines_share_one_task():
+    async def main():
+        flight, runs = AsyncSingleFlight(), []
+
+        async def compute():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return len(runs)
+
+        results = await asyncio.gather(*(flight.run("k", compute) for _ in range(CALLERS)))
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(main())
+    assert runs == [1] and results == [1] * CALLERS
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": CALLERS - 1}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_task():
+    async def main():
+        flight = AsyncSingleFlight()
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def compute():
+            started.set()
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.run("k", compute))
+        await started.wait()
+        second = asyncio.ensure_future(flight.run("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
@@ -0,0 +1,68 @@
+"""
+Ranged requests must return exactly the points of the full-recording result
+that fall inside the range (same timestamps, same values).
+
+Run from the backend folder: python -m pytest
+"""
+import numpy as np
+import pytest
+
+from services.time_range import clip_result, sample_range
+from services.overall_data.windowing import windowed_series
+from services.overall_data.heart_rate import heart_rate_from_beats
+
+RANGES = [(61.3, 200.7), (0.0, 30.0), (3.1, 4.2), (250.0, None)]
+# (fs, window_sec, step_sec): step * fs is not always a whole number of samples.
+GRIDS = [(32.0, 2.5, 0.7), (4.0, 5.0, 1.3), (700.0, 5.0, None), (64.0, 10.0, 0.33)]
+
+
+def _assert_same(ranged, full, start_sec, end_sec):
+    expected = clip_result(full, 0.0, start_sec, end_sec)
+    np.testing.assert_allclose(ranged["x_values"], expected["x_values"], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(ranged["y_values"], expected["y_values"], rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("fs, window_sec, step_sec", GRIDS)
+@pytest.mark.parametrize("start_sec, end_sec", RANGES)
+def test_windowed_series_ranged_matches_full(fs, window_sec, step_sec, start_sec, end_sec):
+    rng = np.random.default_rng(0)
+    y = np.cumsum(rng.normal(size=int(300 * fs)))
+    y[int(100 * fs) : int(101 * fs)] = np.nan
+    full = windowed_series(y, fs, "Time (s)", "y", window_sec=window_sec, step_sec=step_sec)
+
+    i0, i1 = sample_range(y.size, fs, start_sec, end_sec, pad_sec=window_sec, align_sec=step_sec or window_sec)
+    ranged = windowed_series(y[i0:i1], fs, "Time (s)", "y", window_sec=window_sec, step_sec=step_sec)
+    _assert_same(clip_result(ranged, i0 / fs, start_sec, end_sec), full, start_sec, end_sec)
+
+
+def _heart_rate_ranged(beats, n, fs, window_sec, step_sec, start_sec, end_sec):
+    i0, i1 = sample_range(n, fs, start_sec, end_sec, pad_sec=window_sec, align_sec=step_sec or window_sec)
+    inside = beats[(beats >= i0) & (beats < i1)] - i0
+    ranged = heart_rate_from_beats(inside, i1 - i0, fs, window_sec=window_sec, step_sec=step_sec)
+    return clip_result(ranged, i0 / fs, start_sec, end_sec)
+
+
+@pytest.mark.parametrize("fs, window_sec, step_sec", GRIDS)
+@pytest.mark.parametrize("start_sec, end_sec", RANGES)
+def test_heart_rate_ranged_matches_full(fs, window_sec, step_sec, start_sec, end_sec):
+    rng = np.random.default_rng(1)
+    n = int(300 * fs)
+    beats = np.round(np.cumsum(rng.uniform(0.6, 1.1, size=400)) * fs).astype(np.int64)
+    beats = beats[beats < n]
+    full = heart_rate_from_beats(beats, n, fs, window_sec=window_sec, step_sec=step_sec)
+    ranged = _heart_rate_ranged(beats, n, fs, window_sec, step_sec, start_sec, end_sec)
+    _assert_same(ranged, full, start_sec, end_sec)
+
+
+@pytest.mark.parametrize("start_sec, end_sec", RANGES)
+def test_heart_rate_beats_on_window_edges(start_sec, end_sec):
+    # At 700 Hz a 0.7 s step is 490 samples: with beats on multiples of
+    # 35 samples (50 ms) many of them sit exactly on a window start or end.
+    fs, window_sec, step_sec = 700.0, 5.0, 0.7
+    rng = np.random.default_rng(2)
+    n = int(300 * fs)
+    beats = np.cumsum(rng.integers(12, 32, size=2000)) * 35
+    beats = beats[beats < n]
+    full = heart_rate_from_beats(beats, n, fs, window_sec=window_sec, step_sec=step_sec)
+    ranged = _heart_rate_ranged(beats, n, fs, window_sec, step_sec, start_sec, end_sec)
+    _assert_same(ranged, full, start_sec, end_sec)
@@ -0,0 +1,91 @@
+"""
+WSB1 payloads must decode back to the series that was encoded: float32 y
+values, x either rebuilt from t0/fs or shipped as float64, labels intact.
+
+Run from the backend folder: python -m pytest
+"""
+import numpy as np
+import pytest
+
+from services.wire_format import (
+    ARROW_MEDIA_TYPE, BINARY_MEDIA_TYPE, JSON_MEDIA_TYPE, MAGIC, decode_binary, decode_frames, encode,
+    iter_binary_frames, negotiate,
+)
+
+LABELS = {"chart_title": "ECG", "x_label": "Time (s)", "y_label": "mV"}
+
+
+def _uniform(count, t0=12.5, fs=700.0, seed=0):
+    y = np.random.default_rng(seed).normal(size=count)
+    return {**LABELS, "fs": fs, "t0": t0, "dt": 1.0 / fs, "y_values": y}
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 1000])
+def test_uniform_series_round_trip(count):
+    series = _uniform(count)
+    payload = encode(series, BINARY_MEDIA_TYPE)
+    assert payload[:4] == MAGIC
+    out = decode_binary(payload)
+    assert out["header"]["count"] == count
+    assert out["header"]["x_dtype"] is None
+    assert out["header"]["labels"] == LABELS
+    np.testing.assert_array_equal(out["y_values"], series["y_values"].astype(np.float32))
+    np.testing.assert_allclose(out["x_values"], 12.5 + np.arange(count) / 700.0, rtol=0, atol=1e-12)
+
+
+def test_evenly_spaced_x_values_are_not_shipped():
+    series = {**LABELS, "x_values": 5.0 + np.arange(50) * 0.25, "y_values": np.arange(50.0)}
+    out = decode_binary(encode(series, BINARY_MEDIA_TYPE))
+    assert out["header"]["fs"] == 4.0 and out["header"]["x_dtype"] is None
+    np.testing.assert_allclose(out["x_values"], series["x_values"])
+
+
+@pytest.mark.parametrize("count", [3, 4, 101])
+def test_irregular_series_round_trip(count):
+    rng = np.random.default_rng(1)
+    x = np.cumsum(rng.uniform(0.3, 1.7, size=count))
+    y = rng.normal(size=count)
+    y[count // 2] = np.nan
+    out = decode_binary(encode({**LABELS, "x_values": x, "y_values": y}, BINARY_MEDIA_TYPE))
+    assert out["header"]["fs"] is None and out["header"]["x_dtype"] == "<f8"
+    # x is float64, 8-byte aligned after an odd or even number of float32 values.
+    np.testing.assert_array_equal(out["x_values"], x)
+    np.testing.assert_array_equal(out["y_values"], y.astype(np.float32))
+
+
+def test_frames_split_back_into_chunks():
+    chunks = [_uniform(3, t0=0.0), _uniform(0, t0=3 / 700), _uniform(8, t0=3 / 700, seed=2)]
+    chunks.append({**LABELS, "x_values": np.array([1.0, 1.5, 4.0]), "y_values": np.array([1.0, 2.0, 3.0])})
+    frames = list(iter_binary_frames(chunks))
+    assert all(len(frame) % 8 == 0 for frame in frames)
+    decoded = decode_frames(b"".join(frames))
+    assert [d["header"]["count"] for d in decoded] == [3, 0, 8, 3]
+    for chunk, out in zip(chunks, decoded):
+        np.testing.assert_array_equal(out["y_values"], np.asarray(chunk["y_values"], dtype=np.float32))
+    np.testing.assert_array_equal(decoded[-1]["x_values"], [1.0, 1.5, 4.0])
+
+
+def test_decode_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        decode_binary(b"{}")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON_MEDIA_TYPE),
+    ("*/*", JSON_MEDIA_TYPE),
+    ("application/octet-stream", BINARY_MEDIA_TYPE),
+    ("application/json;q=0.5, application/octet-stream", BINARY_MEDIA_TYPE),
+    ("application/octet-stream;q=0, application/json", JSON_MEDIA_TYPE),
+    ("text/html", JSON_MEDIA_TYPE),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    x = np.array([0.0, 0.5, 2.0])
+    payload = encode({**LABELS, "x_values": x, "y_values": np.array([1.0, np.nan, 3.0])}, ARROW_MEDIA_TYPE)
+    table = pa.ipc.open_stream(payload).read_all()
+    np.testing.assert_array_equal(table.column("x").to_numpy(), x)
+    assert table.schema.metadata[b"series"]